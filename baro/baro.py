@@ -1,19 +1,183 @@
 #!/usr/bin/env python3
 
-import serial
-from datetime import datetime
+# Passerelle série → UDP du baromètre (baro.ino): chaque mesure est horodatée et diffusée
+# en trame NMEA XDR sur le réseau du bord, avec la tendance barométrique sur 1 h et 3 h.
 
 # Synology:
 # insmod /lib/modules/cdc-acm.ko
 # /dev/ttyACM0
 
-ser = serial.Serial("/dev/cu.usbmodem101", baudrate=9600)
-
 # https://gpsd.gitlab.io/gpsd/NMEA.html#_xdr_transducer_measurement
 
-while True:
-    line = ser.readline()
+import asyncio
+import functools
+import logging
+import socket
+import time
+from collections import deque
+from datetime import datetime
+
+import click
+import serial
+
+MINUTE = 60
+RECONNECT = 5  # secondes entre deux tentatives d'ouverture du port série
+
+
+def nmea_sentence(body):
+    """Return the sentence `$<body>*<checksum>` with its line ending."""
+    checksum = functools.reduce(lambda a, b: a ^ b, body.encode(), 0)
+    return f"${body}*{checksum:02X}\r\n".encode()
+
+
+class Tendency:
+    """Tendance barométrique sur 1 h et 3 h, calculée en O(1) par mesure.
+
+    Les mesures sont moyennées par minute; les moyennes des 3 dernières heures sont gardées
+    dans un anneau (`deque` de 181 minutes, None pour une minute sans mesure). La tendance est
+    la différence entre la moyenne de la dernière minute et celle d'il y a 1 h ou 3 h.
+    """
+
+    def __init__(self, hours=(1, 3)):
+        self.hours = hours
+        self.minutes = deque(maxlen=max(hours) * 60 + 1)
+        self.minute = None
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, timestamp, pressure):
+        """Add a reading. Return the tendencies `{hours: delta}` when a minute is complete, else None."""
+        minute = int(timestamp // MINUTE)
+        result = None
+        if self.minute is not None and minute != self.minute:
+            self.minutes.append(self.sum / self.count)
+            result = self.tendencies()
+            # minutes sans mesure (au plus la taille de l'anneau)
+            for _ in range(min(minute - self.minute - 1, self.minutes.maxlen)):
+                self.minutes.append(None)
+            self.sum, self.count = 0.0, 0
+        self.minute = minute
+        self.sum += pressure
+        self.count += 1
+        return result
+
+    def tendencies(self):
+        last = self.minutes[-1]
+        result = {}
+        for hours in self.hours:
+            n = hours * 60 + 1
+            if last is not None and len(self.minutes) >= n and self.minutes[-n] is not None:
+                result[hours] = last - self.minutes[-n]
+        return result
+
+
+class Bridge:
+    """Lit les mesures du port série sans bloquer la boucle (`add_reader`) et les diffuse en UDP."""
+
+    def __init__(self, device, baudrate, targets, talker="WI", quiet=False):
+        self.device = device
+        self.baudrate = baudrate
+        self.targets = targets
+        self.talker = talker
+        self.quiet = quiet
+        self.tendency = Tendency()
+        self.buffer = bytearray()
+        self.serial = None
+        self.lost = asyncio.Event()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        if any(address == "<broadcast>" for address, _ in targets):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self.serial = serial.Serial(self.device, baudrate=self.baudrate, timeout=0)
+            except serial.SerialException as e:
+                logging.warning(f"{self.device}: {e}")
+                await asyncio.sleep(RECONNECT)
+                continue
+            logging.info(f"{self.device} ouvert")
+            self.lost.clear()
+            loop.add_reader(self.serial.fileno(), self.readable)
+            await self.lost.wait()
+            loop.remove_reader(self.serial.fileno())
+            self.serial.close()
+            await asyncio.sleep(RECONNECT)
+
+    def readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except OSError as e:  # SerialException, ou EIO de l'ioctl de in_waiting quand l'USB est débranché
+            logging.warning(f"{self.device}: {e}")
+            asyncio.get_running_loop().remove_reader(self.serial.fileno())  # sinon la boucle tourne sur le fd mort
+            self.lost.set()
+            return
+        timestamp = time.time()
+        self.buffer += data
+        while (end := self.buffer.find(b"\n")) >= 0:
+            line = bytes(self.buffer[:end]).decode(errors="replace").strip()
+            del self.buffer[: end + 1]
+            if line:
+                self.reading(timestamp, line)
+        if len(self.buffer) > 1024:
+            self.buffer.clear()
+
+    def reading(self, timestamp, line):
+        if not self.quiet:
+            print(f"{datetime.fromtimestamp(timestamp).isoformat()};{line}", flush=True)
+
+        if line.startswith("$"):
+            self.send(line.encode() + b"\r\n")  # trame NMEA déjà formée
+            return
+
+        # mesure de baro.ino: "<uptime s>;<température °C>;<pression Pa>;"
+        fields = line.split(";")
+        try:
+            temperature, pressure = float(fields[1]), float(fields[2])
+        except (IndexError, ValueError):
+            return  # bannière, messages de démarrage
+
+        self.send(nmea_sentence(f"{self.talker}XDR,P,{pressure / 1e5:.5f},B,Barometer,C,{temperature:.1f},C,AirTemp"))
+        tendencies = self.tendency.add(timestamp, pressure)
+        if tendencies:
+            fields = ",".join(f"P,{delta:.0f},P,PressureTendency{hours}h" for hours, delta in tendencies.items())
+            self.send(nmea_sentence(f"{self.talker}XDR,{fields}"))
+
+    def send(self, data):
+        for target in self.targets:
+            try:
+                self.sock.sendto(data, target)
+            except OSError:
+                pass
+
+
+def parse_target(target, port):
+    """Return `(address, port)` from `host` or `host:port`."""
+    host, _, p = target.rpartition(":")
+    if not host:
+        host, p = p, port
+    if host == "<broadcast>":
+        return host, int(p)
+    return socket.gethostbyname(host), int(p)
+
+
+@click.command(help="Passerelle série → UDP NMEA du baromètre")
+@click.option("-d", "--device", default="/dev/ttyACM0", show_default=True, help="Port série")
+@click.option("-b", "--baudrate", type=int, default=9600, show_default=True, help="Vitesse du port série")
+@click.option("-a", "--address", "addresses", multiple=True, help="Destination UDP host[:port] (répétable)")
+@click.option("-p", "--port", type=int, default=11101, show_default=True, help="Port UDP")
+@click.option("-q", "--quiet", is_flag=True, help="N'affiche pas les mesures")
+def main(device, baudrate, addresses, port, quiet):
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    targets = [parse_target(address, port) for address in addresses or ["<broadcast>"]]
+    bridge = Bridge(device, baudrate, targets, quiet=quiet)
+    try:
+        asyncio.run(bridge.run())
+    except KeyboardInterrupt:
+        pass
+
 
-    now = datetime.now()
-    line = line.decode().rstrip()
-    print(f"{now.isoformat()};{line}")
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,98 @@
 #!/usr/bin/env python3
 
-import json
+from datetime import datetime
+from pathlib import Path
 
 import click
-import pyais
-import simplekml
+
+from aivdm import Selection, read_messages
+from jsonout import JsonWriter
+from tracks import Track, open_writer
+
+
+def parse_bbox(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        lon_min, lat_min, lon_max, lat_max = map(float, value.split(","))
+    except ValueError:
+        raise click.BadParameter("must be lon_min,lat_min,lon_max,lat_max")
+    return lon_min, lat_min, lon_max, lat_max
 
 
 @click.command(help="AIS")
-@click.option("--mmsi", help="filtre par MMSI", type=int)
-@click.option("--gps", "flag_gps", help="trace gps", is_flag=True)
+@click.option("--mmsi", help="filtre par MMSI (répétable)", type=int, multiple=True)
+@click.option("--type", "types", help="filtre par type de message (répétable)", type=int, multiple=True)
+@click.option("--bbox", help="filtre par position: lon_min,lat_min,lon_max,lat_max", callback=parse_bbox)
+@click.option("--gps", "flag_gps", help="traces gps de tous les navires (ou du MMSI filtré)", is_flag=True)
+@click.option("-o", "--output", type=Path, help="fichier des traces: .kml, .gpx ou .geojson")
+@click.option("--split", is_flag=True, help="un fichier de traces par navire")
+@click.option("--min-time", type=float, default=0, help="intervalle minimal entre deux points d'une trace (s)")
+@click.option("--min-distance", type=float, default=0, help="distance minimale entre deux points d'une trace (m)")
 @click.option("--json", "flag_json", help="json output", is_flag=True)
+@click.option("--ndjson", "flag_ndjson", help="json output, un message par ligne", is_flag=True)
+@click.option("--fields", help="champs des messages en sortie json (ex: mmsi,lon,lat,speed)")
+@click.option("-j", "--jobs", type=click.IntRange(0), default=1, help="Nombre de processus (0: un par cœur)")
 @click.argument("filenames", type=str, nargs=-1)
-def main(mmsi, flag_gps, flag_json, filenames):
-    multipart_ais = None
-    coords = []
-    first = True
+def main(
+    mmsi, types, bbox, flag_gps, output, split, min_time, min_distance, flag_json, flag_ndjson, fields, jobs, filenames
+):
+    tracks = {}
+    shipnames = {}
+    writer = None
 
     if flag_gps:
-        flag_json = False
-
-    if flag_json:
-        print("[")
-
-    for filename in filenames:
-        for line in open(filename):
-            timestamp, nmea = line.split(" ", 1)
-            if nmea.startswith("!"):
-                try:
-                    if multipart_ais:
-                        message = pyais.decode(multipart_ais, nmea)
-                        multipart_ais = None
-                    else:
-                        message = pyais.decode(nmea)
-
-                    if mmsi and int(message.mmsi) != mmsi:
-                        continue
-
-                    if flag_gps:
-                        if "lon" in message.asdict():
-                            coords.append((message.lon, message.lat))
-                    else:
-                        if flag_json:
-                            data = {"timestamp": timestamp, "message": message.asdict()}
-                            if first:
-                                first = False
-                            else:
-                                print(",")
-
-                            print(json.dumps(data, indent=2), end="")
-                        else:
-                            print(timestamp, message)
-
-                except pyais.exceptions.MissingMultipartMessageException as e:
-                    if multipart_ais is not None:
-                        raise e
-                    multipart_ais = nmea
-
-    if flag_json:
-        print("\n]")
+        flag_json = flag_ndjson = False
+
+    if flag_json or flag_ndjson:
+        writer = JsonWriter(ndjson=flag_ndjson)
+        fields = fields.split(",") if fields else None
+
+    selection = Selection(mmsi, types, bbox) if mmsi or types or bbox else None
+
+    for timestamp, message in read_messages(filenames, selection, jobs):
+        if flag_gps:
+            lat, lon = getattr(message, "lat", None), getattr(message, "lon", None)
+            if lat is not None and lon is not None and abs(lat) <= 90 and abs(lon) <= 180:
+                track = tracks.get(message.mmsi)
+                if track is None:
+                    track = tracks[message.mmsi] = Track(message.mmsi, min_time, min_distance)
+                track.add(timestamp, lat, lon)
+            if getattr(message, "shipname", None):
+                shipnames[message.mmsi] = message.shipname
+        elif writer:
+            if fields:
+                data = {field: getattr(message, field) for field in fields if hasattr(message, field)}
+            else:
+                data = message.asdict()
+            writer.write({"timestamp": datetime.fromtimestamp(timestamp).isoformat(), "message": data})
+        else:
+            print(datetime.fromtimestamp(timestamp).isoformat(), message)
+
+    if writer:
+        writer.close()
 
     if flag_gps:
-        kml = simplekml.Kml(open=1)
-        linestring = kml.newlinestring(name=f"mmsi {mmsi}")
-        linestring.coords = coords
-        linestring.altitudemode = simplekml.AltitudeMode.clamptoground
-        output = f"{mmsi}.kml"
-        kml.save(output)
-        print(f"trace gps dans: {output}")
+        if output is None:
+            output = Path(f"{mmsi[0]}.kml" if len(mmsi) == 1 else "ais.kml")
+
+        def name(track):
+            shipname = shipnames.get(track.name)
+            return f"mmsi {track.name}" + (f" {shipname}" if shipname else "")
+
+        if split:
+            for track in tracks.values():
+                filename = output.with_name(f"{output.stem}_{track.name}{output.suffix}")
+                with open_writer(filename) as track_writer:
+                    track.name = name(track)
+                    track_writer.track(track)
+            print(f"{len(tracks)} traces gps dans: {output.with_name(f'{output.stem}_*{output.suffix}')}")
+        else:
+            with open_writer(output) as track_writer:
+                for track in tracks.values():
+                    track.name = name(track)
+                    track_writer.track(track)
+            print(f"{len(tracks)} traces gps dans: {output}")
 
 
 if __name__ == "__main__":
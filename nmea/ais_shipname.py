@@ -1,47 +1,36 @@
 #!/usr/bin/env python3
 
-from operator import itemgetter
+from datetime import datetime
 
 import click
-import pyais
+
+from vessels import Registry
 
 
 @click.command(help="Extrait les shipnames de trames NMEA AIS")
 @click.option("-a", "--all", "all_mmsi", help="toutes les données", is_flag=True)
+@click.option("-j", "--jobs", type=click.IntRange(0), default=1, help="Nombre de processus (0: un par cœur)")
+@click.option("-d", "--db", "database", help="Registre des navires (SQLite), mis à jour avec les nouvelles trames")
+@click.option("--history", is_flag=True, help="Affiche les changements de nom")
 @click.argument("filenames", type=str, nargs=-1)
-def main(all_mmsi, filenames):
-    multipart_ais = None
-    ships = {}
-
-    for filename in filenames:
-        for line in open(filename):
-            timestamp, nmea = line.split(" ", 1)
-            if nmea.startswith("!"):
-                try:
-                    if multipart_ais:
-                        message = pyais.decode(multipart_ais, nmea)
-                        multipart_ais = None
-                    else:
-                        message = pyais.decode(nmea)
-
-                    if message.mmsi not in ships:
-                        ships[message.mmsi] = "?"
-
-                    if "shipname" in message.asdict():
-                        name = ships[message.mmsi]
-                        if name != "?" and name != message.shipname:
-                            print("mmsi/shipname mismatch:", message.mmsi, message.shipname, ships[message.mmsi])
-                            exit(2)
-                        ships[message.mmsi] = message.shipname
-
-                except pyais.exceptions.MissingMultipartMessageException as e:
-                    if multipart_ais is not None:
-                        raise e
-                    multipart_ais = nmea
-
-    for mmsi, name in sorted(ships.items(), key=itemgetter(0)):
-        if all_mmsi or name != "?":
-            print(f"{mmsi:8} {name}")
+def main(all_mmsi, jobs, database, history, filenames):
+    with Registry(database or ":memory:") as registry:
+        count = registry.update(filenames, jobs=jobs)
+        if database:
+            print(f"{count} nouveaux messages")
+
+        for vessel in registry:
+            name = vessel["shipname"] or "?"
+            if all_mmsi or name != "?":
+                print(f"{vessel['mmsi']:8} {name}")
+                if not history:
+                    continue
+                names = registry.history(vessel["mmsi"])
+                if len(names) > 1:
+                    for shipname, first_seen, last_seen in names:
+                        first_seen = datetime.fromtimestamp(first_seen).isoformat(timespec="seconds")
+                        last_seen = datetime.fromtimestamp(last_seen).isoformat(timespec="seconds")
+                        print(f"{'':8}   {shipname:<20} {first_seen} → {last_seen}")
 
 
 if __name__ == "__main__":
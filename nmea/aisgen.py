@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# Générateur de trafic AIS/NMEA synthétique: N navires en mouvement et le bateau (RMC, GLL),
+# envoyés en UDP en temps réel ou écrits dans une capture, pour tester les décodeurs en charge.
+# AIS info: https://gpsd.gitlab.io/gpsd/AIVDM.html
+
+import asyncio
+import heapq
+import math
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import click
+import pyais
+
+from fanout import Fanout, parse_target
+from nmea0183 import nmea_checksum
+from nmealog import NmeaLogWriter
+from replay import Scheduler
+
+AREA = (-5.6, 48.2, -4.8, 48.7)  # lon min, lat min, lon max, lat max: rail d'Ouessant
+METERS_PER_DEGREE = 111195
+STATIC_INTERVAL = 360  # secondes entre deux messages statiques (type 5, 24)
+ARMOR = bytes(c + 48 if c < 40 else c + 56 for c in range(64))
+SHIP_TYPES = (30, 36, 37, 52, 60, 70, 71, 80, 89)
+
+
+def armor(fields):
+    """Return the armoured payload and the fill bits of the `(value, nbits)` fields."""
+    bits = nbits = 0
+    for value, n in fields:
+        bits = bits << n | (value & ((1 << n) - 1))
+        nbits += n
+    fill = -nbits % 6
+    bits <<= fill
+    n = (nbits + fill) // 6
+    return bytes(ARMOR[(bits >> (6 * (n - 1 - i))) & 63] for i in range(n)), fill
+
+
+def sentence(payload, fill, channel, count=1, number=1, seq_id=b""):
+    body = b"!AIVDM,%d,%d,%s,%s,%s,%d" % (count, number, seq_id, channel, payload, fill)
+    return b"%s*%02X" % (body, nmea_checksum(body + b"*"))
+
+
+class Vessel:
+    """Navire simulé: cap et vitesse qui varient lentement, rebond sur les bords de la zone."""
+
+    __slots__ = (
+        "mmsi", "class_a", "assigned", "lat", "lon", "sog", "cog", "turn", "shipname", "callsign", "ship_type", "dims",
+    )  # fmt: skip
+
+    def __init__(self, rng, mmsi, area):
+        lon_min, lat_min, lon_max, lat_max = area
+        self.mmsi = mmsi
+        self.class_a = rng.random() < 0.7
+        self.lat = rng.uniform(lat_min, lat_max)
+        self.lon = rng.uniform(lon_min, lon_max)
+        self.sog = rng.choice((0.0, rng.uniform(4, 25))) if self.class_a else rng.uniform(0, 8)
+        self.cog = rng.uniform(0, 360)
+        self.turn = 0.0  # degrés par seconde
+        self.shipname = f"SYNTH {mmsi % 100000:05d}"
+        self.callsign = f"F{mmsi % 10000:04d}"
+        self.ship_type = rng.choice(SHIP_TYPES) if self.class_a else 37
+        self.dims = (rng.randint(10, 200), rng.randint(5, 100), rng.randint(2, 20), rng.randint(2, 20))
+        self.assigned = self.class_a and rng.random() < 0.1  # cadence imposée par une station de base: type 2
+
+    def move(self, rng, dt, area):
+        if rng.random() < 0.01 * dt:
+            self.turn = rng.choice((0.0, 0.0, rng.uniform(-1, 1)))
+        self.cog = (self.cog + self.turn * dt) % 360
+        d = self.sog * 1852 / 3600 * dt / METERS_PER_DEGREE
+        self.lat += d * math.cos(math.radians(self.cog))
+        self.lon += d * math.sin(math.radians(self.cog)) / math.cos(math.radians(self.lat))
+        lon_min, lat_min, lon_max, lat_max = area
+        if not lat_min <= self.lat <= lat_max:
+            self.cog = (180 - self.cog) % 360
+            self.lat = min(max(self.lat, lat_min), lat_max)
+        if not lon_min <= self.lon <= lon_max:
+            self.cog = (-self.cog) % 360
+            self.lon = min(max(self.lon, lon_min), lon_max)
+
+    def interval(self):
+        """Reporting interval in seconds (ITU-R M.1371: depends on the speed and the turns)."""
+        if not self.class_a:
+            return 30 if self.sog > 2 else 180
+        if self.sog < 0.1:
+            return 180
+        if self.turn:
+            return 3.33 if self.sog < 14 else 2
+        return 10 if self.sog < 14 else 6 if self.sog < 23 else 2
+
+    def position(self, timestamp, channel):
+        lon, lat = round(self.lon * 600000), round(self.lat * 600000)
+        sog, cog = min(round(self.sog * 10), 1022), round(self.cog * 10) % 3600
+        heading, second = round(self.cog) % 360, int(timestamp) % 60
+        if self.class_a:
+            turn = max(-126, min(126, round(4.733 * math.sqrt(abs(self.turn) * 60)) * (1 if self.turn >= 0 else -1)))
+            msg_type = 3 if self.sog < 0.1 else 2 if self.assigned else 1
+            status = 0 if self.sog >= 0.1 else 1
+            fields = (
+                (msg_type, 6), (0, 2), (self.mmsi, 30), (status, 4), (turn, 8), (sog, 10), (0, 1),
+                (lon, 28), (lat, 27), (cog, 12), (heading, 9), (second, 6), (0, 2), (0, 3), (0, 1), (0, 19),
+            )  # fmt: skip
+        else:
+            fields = (
+                (18, 6), (0, 2), (self.mmsi, 30), (0, 8), (sog, 10), (0, 1), (lon, 28), (lat, 27),
+                (cog, 12), (heading, 9), (second, 6), (0, 2), (1, 1), (0, 1), (1, 1), (1, 1), (1, 1),
+                (0, 1), (0, 1), (0, 20),
+            )  # fmt: skip
+        return [sentence(*armor(fields), channel)]
+
+    def static(self, seq_id, channel):
+        to_bow, to_stern, to_port, to_starboard = self.dims
+        common = {"mmsi": self.mmsi, "ship_type": self.ship_type, "callsign": self.callsign}
+        dims = {"to_bow": to_bow, "to_stern": to_stern, "to_port": to_port, "to_starboard": to_starboard}
+        if self.class_a:
+            messages = [{"type": 5, "shipname": self.shipname, "destination": "BREST", **common, **dims}]
+        else:
+            messages = [
+                {"type": 24, "partno": 0, "mmsi": self.mmsi, "shipname": self.shipname},
+                {"type": 24, "partno": 1, **common, **dims},
+            ]
+        sentences = []
+        for message in messages:
+            sentences.extend(
+                s.encode()
+                for s in pyais.encode_dict(message, radio_channel=channel.decode(), sentence_type="VDM", seq_id=seq_id)
+            )
+        return sentences
+
+
+def own_ship(vessel, timestamp):
+    """Return the RMC and GLL sentences of the own ship."""
+    t = datetime.fromtimestamp(timestamp, timezone.utc)
+    hms = t.strftime("%H%M%S") + f".{t.microsecond // 10000:02d}"
+    lat = f"{int(abs(vessel.lat)):02d}{abs(vessel.lat) % 1 * 60:07.4f},{'N' if vessel.lat >= 0 else 'S'}"
+    lon = f"{int(abs(vessel.lon)):03d}{abs(vessel.lon) % 1 * 60:07.4f},{'E' if vessel.lon >= 0 else 'W'}"
+    sentences = []
+    for body in (
+        f"$GPRMC,{hms},A,{lat},{lon},{vessel.sog:.1f},{vessel.cog:.1f},{t:%d%m%y},,,A*",
+        f"$GPGLL,{lat},{lon},{hms},A,A*",
+    ):
+        body = body.encode()
+        sentences.append(body + b"%02X" % nmea_checksum(body))
+    return sentences
+
+
+def generate(count, start, duration=None, load=1.0, area=AREA, seed=None):
+    """Yield `(timestamp, sentence)` of the simulated traffic, in time order.
+
+    `load` multiplies the reporting rates of the vessels (10: ten times the real load).
+    The own ship sends RMC and GLL every second.
+    """
+    rng = random.Random(seed)
+    vessels = [Vessel(rng, 227000000 + i, area) for i in range(count)]
+    own = Vessel(rng, 0, area)
+    own.class_a, own.sog = True, 8.0
+
+    # événements: (instant, numéro, navire, dernier déplacement, statique)
+    events = [(start + rng.uniform(0, v.interval() / load), i, v, start, False) for i, v in enumerate(vessels)]
+    events += [
+        (start + rng.uniform(0, STATIC_INTERVAL / load), count + i, v, None, True) for i, v in enumerate(vessels)
+    ]
+    events.append((start, -1, own, start, False))
+    heapq.heapify(events)
+    channels = (b"A", b"B")
+    n = 0
+
+    while events:
+        timestamp, i, vessel, moved, static = events[0]
+        if duration is not None and timestamp >= start + duration:
+            return
+        n += 1
+        channel = channels[n % 2]
+
+        if static:
+            sentences = vessel.static(n % 10, channel)
+            heapq.heapreplace(events, (timestamp + STATIC_INTERVAL / load, i, vessel, None, True))
+        else:
+            vessel.move(rng, timestamp - moved, area)
+            if vessel is own:
+                sentences = own_ship(vessel, timestamp)
+                next_time = timestamp + 1
+            else:
+                sentences = vessel.position(timestamp, channel)
+                next_time = timestamp + vessel.interval() / load
+            heapq.heapreplace(events, (next_time, i, vessel, timestamp, False))
+
+        for s in sentences:
+            yield timestamp, s
+
+
+@click.command(help="Génère du trafic AIS/NMEA synthétique")
+@click.option("-n", "--vessels", type=int, default=300, show_default=True, help="Nombre de navires")
+@click.option("-l", "--load", type=float, default=1.0, show_default=True, help="Multiplicateur des cadences AIS")
+@click.option("-d", "--duration", type=float, help="Durée simulée en secondes")
+@click.option("-o", "--output", type=Path, help="Capture à écrire (.txt ou .nmealog), sans cadencement")
+@click.option("-a", "--address", "addresses", multiple=True, help="Destination UDP host[:port] (répétable)")
+@click.option("-p", "--port", type=int, default=11101, help="Port UDP")
+@click.option("--seed", type=int, help="Graine du générateur aléatoire")
+def main(vessels, load, duration, output, addresses, port, seed):
+    if output:
+        start = time.time()
+        if duration is None:
+            duration = 3600
+        count = 0
+        if output.suffix == ".nmealog":
+            with NmeaLogWriter(output) as writer:
+                for timestamp, s in generate(vessels, start, duration, load, seed=seed):
+                    writer.write(timestamp, s)
+                    count += 1
+        else:
+            with output.open("w") as f:
+                for timestamp, s in generate(vessels, start, duration, load, seed=seed):
+                    f.write(f"{datetime.fromtimestamp(timestamp).isoformat()} {s.decode()}\n")
+                    count += 1
+        print(f"{count} trames en {duration:g} s simulées, {count / duration:.0f} trames/s")
+        return
+
+    targets = [parse_target(address, port) for address in addresses or ["localhost"]]
+
+    async def run():
+        fanout = Fanout(targets)
+        scheduler = Scheduler()
+        try:
+            for timestamp, s in generate(vessels, time.time(), duration, load, seed=seed):
+                await scheduler.wait(timestamp)
+                fanout.send(s + b"\r\n")
+        finally:
+            await fanout.close()
+            print(scheduler.report())
+            print(fanout.report())
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
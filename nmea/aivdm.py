@@ -0,0 +1,262 @@
+# Réassemblage et décodage des trames AIS (!AIVDM, !AIVDO), partagés par ais.py et ais_shipname.py.
+# AIS info: https://gpsd.gitlab.io/gpsd/AIVDM.html
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import pyais
+
+from nmea0183 import chunks, read_chunk
+
+TIMEOUT = 10  # délai maximal (en secondes) entre le premier et le dernier fragment d'un message
+MAX_PENDING = 1000  # messages incomplets conservés au plus
+OVERRUN = 1000  # trames lues après la fin d'un morceau pour compléter ses messages
+
+
+class Reassembler:
+    """Réassemble les messages AIS en plusieurs fragments.
+
+    Les fragments sont regroupés par (identifiant séquentiel, canal, nombre de fragments),
+    ce qui permet à plusieurs messages de s'entrelacer (deux canaux, plusieurs émetteurs).
+    Les messages incomplets sont abandonnés après `timeout` secondes, ou les plus anciens
+    quand plus de `max_pending` sont en attente.
+    """
+
+    def __init__(self, timeout=TIMEOUT, max_pending=MAX_PENDING):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = {}  # clé → [horodatage du premier fragment, fragments]
+        self.orphans = 0  # messages incomplets abandonnés
+        self.skipped = 0  # fragments sans premier fragment
+
+    def expire(self, timestamp):
+        pending = self.pending
+        while pending:
+            key = next(iter(pending))
+            if timestamp - pending[key][0] <= self.timeout and len(pending) <= self.max_pending:
+                break
+            del pending[key]
+            self.orphans += 1
+
+    def add(self, sentence, start=True):
+        """Add a fragment (`Sentence`). Return `(timestamp, fragments)` when its message is complete.
+
+        With `start=False`, only pending messages are completed: new ones are ignored.
+        """
+        fields = sentence.raw.split(b",", 6)
+        if len(fields) < 7:
+            self.skipped += 1
+            return None
+        count, number, seq_id, channel = fields[1], fields[2], fields[3], fields[4]
+
+        if count == b"1":
+            return (sentence.timestamp, [sentence.raw]) if start else None
+
+        key = (seq_id, channel, count)
+        pending = self.pending
+        if number == b"1":
+            if not start:
+                return None
+            if key in pending:
+                del pending[key]  # identifiant réutilisé avant la fin du message précédent
+                self.orphans += 1
+            pending[key] = [sentence.timestamp, [sentence.raw]]
+            self.expire(sentence.timestamp)
+            return None
+
+        message = pending.get(key)
+        if message is None or len(message[1]) + 1 != int(number):
+            if message is not None:
+                del pending[key]
+                self.orphans += 1
+            self.skipped += 1
+            return None
+
+        message[1].append(sentence.raw)
+        if number == count:
+            del pending[key]
+            return message[0], message[1]
+        return None
+
+
+def messages(sentences, reassembler=None):
+    """Yield `(timestamp, fragments)` of the complete AIS messages of a flow of sentences."""
+    reassembler = reassembler or Reassembler()
+    for sentence in sentences:
+        if sentence.is_ais:
+            message = reassembler.add(sentence)
+            if message:
+                yield message
+
+
+# valeur 6 bits de chaque caractère de la charge utile
+SIXBIT = bytes((c - 48 if c < 88 else c - 56) & 0x3F for c in range(256))
+
+# position des champs lon/lat dans la charge utile: (bit de début, nombre de bits, unité en minutes)
+POSITIONS = {
+    1: (61, 28, 89, 27, 1e-4),
+    2: (61, 28, 89, 27, 1e-4),
+    3: (61, 28, 89, 27, 1e-4),
+    4: (79, 28, 107, 27, 1e-4),
+    9: (61, 28, 89, 27, 1e-4),
+    11: (79, 28, 107, 27, 1e-4),
+    18: (57, 28, 85, 27, 1e-4),
+    19: (57, 28, 85, 27, 1e-4),
+    21: (164, 28, 192, 27, 1e-4),
+    27: (44, 18, 62, 17, 0.1),
+}
+
+
+def payload_bits(payload, nbits):
+    """Return the first `nbits` of an armoured payload as an integer (0-padded if shorter)."""
+    nchars = (nbits + 5) // 6
+    value = 0
+    for c in payload[:nchars]:
+        value = value << 6 | SIXBIT[c]
+    value <<= 6 * (nchars - min(len(payload), nchars))
+    return value >> (6 * nchars - nbits)
+
+
+def signed(value, nbits):
+    return value - (1 << nbits) if value >> (nbits - 1) else value
+
+
+# vitesse et route des messages de position des mobiles: (bit de début, nombre de bits, unité en nœuds)
+# puis (bit de début, nombre de bits, unité en degrés)
+MOTIONS = {
+    1: (50, 10, 0.1, 116, 12, 0.1),
+    2: (50, 10, 0.1, 116, 12, 0.1),
+    3: (50, 10, 0.1, 116, 12, 0.1),
+    9: (50, 10, 1.0, 116, 12, 0.1),
+    18: (46, 10, 0.1, 112, 12, 0.1),
+    19: (46, 10, 0.1, 112, 12, 0.1),
+    27: (79, 6, 1.0, 85, 9, 1.0),
+}
+
+
+def position_report(fragment):
+    """Return `(mmsi, lon, lat, sog, cog)` of a position report of a mobile, read from the payload bits
+    without a full decoding. SOG and COG are None when not available. Return None for other messages."""
+    payload = fragment.split(b",", 6)[5]
+    motion = MOTIONS.get(SIXBIT[payload[0]]) if payload else None
+    if motion is None:
+        return None
+    speed_start, speed_bits, speed_unit, course_start, course_bits, course_unit = motion
+    lon_start, lon_bits, lat_start, lat_bits, unit = POSITIONS[SIXBIT[payload[0]]]
+    nbits = course_start + course_bits
+    bits = payload_bits(payload, nbits)
+
+    def field(start, n):
+        return bits >> (nbits - start - n) & ((1 << n) - 1)
+
+    lon = signed(field(lon_start, lon_bits), lon_bits) * unit / 60
+    lat = signed(field(lat_start, lat_bits), lat_bits) * unit / 60
+    sog = field(speed_start, speed_bits)
+    sog = None if sog >= (1 << speed_bits) - 2 else sog * speed_unit
+    cog = field(course_start, course_bits) * course_unit
+    return field(8, 30), round(lon, 6), round(lat, 6), sog, None if cog >= 360 else cog
+
+
+class Selection:
+    """Pré-filtre des messages AIS sur le type, le MMSI et la position (rectangle lon/lat).
+
+    Seuls les premiers bits de la charge utile sont décodés, ce qui évite le décodage complet
+    des messages rejetés. Le rectangle ne s'applique qu'aux messages qui portent une position.
+    """
+
+    def __init__(self, mmsis=None, types=None, bbox=None):
+        self.mmsis = set(mmsis) if mmsis else None
+        self.types = set(types) if types else None
+        self.bbox = bbox  # (lon min, lat min, lon max, lat max)
+        self.cache = {}  # 7 premiers caractères → type et MMSI acceptés
+
+    def __call__(self, fragment):
+        """Return True if the message of which `fragment` is the first fragment is selected."""
+        payload = fragment.split(b",", 6)[5]
+        header = self.cache.get(payload[:7])
+        if header is None:
+            if len(self.cache) >= 100_000:
+                self.cache.clear()
+            bits = payload_bits(payload, 38)
+            msg_type = bits >> 32
+            selected = (self.types is None or msg_type in self.types) and (
+                self.mmsis is None or bits & 0x3FFFFFFF in self.mmsis
+            )
+            header = self.cache[payload[:7]] = (selected, msg_type)
+        selected, msg_type = header
+        if not selected:
+            return False
+        if self.bbox is not None and msg_type in POSITIONS:
+            lon_start, lon_bits, lat_start, lat_bits, unit = POSITIONS[msg_type]
+            bits = payload_bits(payload, lat_start + lat_bits)
+            lon = signed(bits >> (lat_start + lat_bits - lon_start - lon_bits) & ((1 << lon_bits) - 1), lon_bits)
+            lat = signed(bits & ((1 << lat_bits) - 1), lat_bits)
+            lon, lat = lon * unit / 60, lat * unit / 60
+            lon_min, lat_min, lon_max, lat_max = self.bbox
+            if not (lon_min <= lon <= lon_max and lat_min <= lat <= lat_max):
+                return False
+        return True
+
+
+def decode(fragments):
+    """Decode a reassembled message. Return None if it is invalid."""
+    try:
+        return pyais.decode(*fragments)
+    except pyais.exceptions.AISBaseException as e:
+        logging.debug(f"{e}: {fragments}")
+        return None
+
+
+def decode_chunk(chunk, selection=None):
+    """Decode the AIS messages of a chunk `(filename, start, end)`, see `nmea0183.chunks`.
+
+    Return the list of `(timestamp, message)` sorted by timestamp, restricted by `selection` if given.
+    The messages that begin in the chunk are completed with the sentences that follow it.
+    """
+    filename, start, end = chunk
+    reassembler = Reassembler()
+    decoded = []
+
+    def add(timestamp, fragments):
+        if selection is not None and not selection(fragments[0]):
+            return
+        message = decode(fragments)
+        if message is not None:
+            decoded.append((timestamp, message))
+
+    for timestamp, fragments in messages(read_chunk(filename, start, end), reassembler):
+        add(timestamp, fragments)
+
+    if end is not None and reassembler.pending:
+        for n, sentence in enumerate(read_chunk(filename, end)):
+            if n >= OVERRUN or not reassembler.pending:
+                break
+            if sentence.is_ais:
+                message = reassembler.add(sentence, start=False)
+                if message:
+                    add(*message)
+
+    # dans l'ordre du premier fragment, quel que soit le découpage
+    decoded.sort(key=itemgetter(0))
+    return decoded
+
+
+def decode_chunks(tasks, selection=None, jobs=1):
+    """Yield `(chunk, decoded)` for each chunk, in order, see `decode_chunk`.
+
+    With `jobs` other than 1, the chunks are decoded by a process pool (0: one per core).
+    """
+    if jobs == 1 or len(tasks) == 1:
+        for task in tasks:
+            yield task, decode_chunk(task, selection)
+    else:
+        with ProcessPoolExecutor(jobs or None) as executor:
+            yield from zip(tasks, executor.map(decode_chunk, tasks, [selection] * len(tasks)))
+
+
+def read_messages(filenames, selection=None, jobs=1, chunk_size=64 * 1024 * 1024):
+    """Yield `(timestamp, message)` of the AIS messages of several captures, in order."""
+    tasks = [c for filename in filenames for c in chunks(filename, chunk_size)]
+    for _, decoded in decode_chunks(tasks, selection, jobs):
+        yield from decoded
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+# Risque de collision: CPA/TCPA entre le bateau (RMC/GLL) et les cibles AIS, et entre cibles.
+# Les cibles sont rangées dans une grille (hachage spatial) pour ne calculer que les paires voisines.
+
+import asyncio
+import math
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import click
+import numpy as np
+
+from aivdm import Reassembler, position_report
+from nmea0183 import Sentence, read_sentences
+
+EARTH_RADIUS = 6371000  # mètres
+NM = 1852  # mètres
+KNOT = NM / 3600  # m/s
+
+RANGE = 6 * NM  # portée de la surveillance, et taille des cases de la grille
+CPA_LIMIT = 0.5 * NM
+TCPA_LIMIT = 20 * 60  # secondes
+MAX_AGE = 6 * 60  # une cible sans nouvelle position depuis MAX_AGE secondes est oubliée
+INTERVAL = 1.0  # intervalle (en secondes, temps de la capture) entre deux calculs
+VELOCITY_AGE = 10  # secondes pendant lesquelles la vitesse (SOG/COG) d'un RMC ou du transpondeur reste celle du bateau
+CELL_BIAS = 1 << 20  # les coordonnées de case (décalées) sont codées sur 21 bits
+
+
+def cpa_tcpa(dx, dy, dvx, dvy):
+    """Return the CPA (meters) and TCPA (seconds) of relative positions `(dx, dy)` and velocities `(dvx, dvy)`.
+
+    The TCPA is 0 when the distance is increasing (or constant): the CPA is then the current distance.
+    """
+    dv2 = dvx * dvx + dvy * dvy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tcpa = np.where(dv2 > 1e-9, -(dx * dvx + dy * dvy) / dv2, 0.0)
+    tcpa = np.maximum(tcpa, 0.0)
+    cpa = np.hypot(dx + dvx * tcpa, dy + dvy * tcpa)
+    return cpa, tcpa
+
+
+class Traffic:
+    """Cibles AIS: positions projetées (mètres) et vitesses dans des tableaux NumPy, indexées par une grille.
+
+    La projection est équirectangulaire autour de la première position reçue, suffisante à l'échelle d'une zone de trafic.
+    """
+
+    def __init__(self, cell=RANGE, capacity=1024):
+        self.cell = cell
+        self.origin = None
+        self.rows = {}  # mmsi → ligne des tableaux
+        self.mmsis = np.zeros(capacity, dtype=np.int64)
+        self.state = np.zeros((capacity, 5))  # x, y, vx, vy, horodatage
+        self.grid = defaultdict(set)  # case → lignes
+        self.cells = {}  # ligne → case
+        self.free = []
+
+    def project(self, lat, lon):
+        if self.origin is None:
+            self.origin = (lat, lon, math.cos(math.radians(lat)))
+        lat0, lon0, k = self.origin
+        return math.radians(lon - lon0) * k * EARTH_RADIUS, math.radians(lat - lat0) * EARTH_RADIUS
+
+    def key(self, x, y):
+        return int(x // self.cell), int(y // self.cell)
+
+    def update(self, mmsi, timestamp, lat, lon, sog, cog):
+        x, y = self.project(lat, lon)
+        if sog is None or cog is None:
+            vx = vy = 0.0  # vitesse ou route non disponible
+        else:
+            v = sog * KNOT
+            vx, vy = v * math.sin(math.radians(cog)), v * math.cos(math.radians(cog))
+
+        row = self.rows.get(mmsi)
+        if row is None:
+            row = self.free.pop() if self.free else len(self.rows)
+            if row >= len(self.mmsis):
+                self.mmsis = np.resize(self.mmsis, 2 * len(self.mmsis))
+                self.state = np.resize(self.state, (2 * len(self.state), 5))
+            self.rows[mmsi] = row
+            self.mmsis[row] = mmsi
+        self.state[row] = (x, y, vx, vy, timestamp)
+
+        key = self.key(x, y)
+        old = self.cells.get(row)
+        if old != key:
+            if old is not None:
+                self.grid[old].discard(row)
+                if not self.grid[old]:
+                    del self.grid[old]
+            self.grid[key].add(row)
+            self.cells[row] = key
+
+    def expire(self, now):
+        if not self.rows:
+            return
+        rows = np.fromiter(self.rows.values(), dtype=np.int64, count=len(self.rows))
+        for row in rows[now - self.state[rows, 4] > MAX_AGE]:
+            self.remove(int(self.mmsis[row]))
+
+    def remove(self, mmsi):
+        row = self.rows.pop(mmsi, None)
+        if row is None:
+            return
+        key = self.cells.pop(row)
+        self.grid[key].discard(row)
+        if not self.grid[key]:
+            del self.grid[key]
+        self.free.append(row)
+
+    def near(self, x, y, radius):
+        """Return the rows of the targets in the cells within `radius` of `(x, y)`."""
+        n = int(math.ceil(radius / self.cell))
+        cx, cy = self.key(x, y)
+        rows = []
+        for i in range(cx - n, cx + n + 1):
+            for j in range(cy - n, cy + n + 1):
+                rows.extend(self.grid.get((i, j), ()))
+        return np.array(rows, dtype=np.int64)
+
+    def pairs(self):
+        """Return the rows `(a, b)` of the pairs of targets in the same or adjacent cells, each pair once.
+
+        The targets are sorted by cell: the targets of a neighbour cell are a range found by binary search.
+        """
+        n = len(self.cells)
+        rows = np.fromiter(self.cells.keys(), dtype=np.int64, count=n)
+        cells = np.array(list(self.cells.values()), dtype=np.int64).reshape(n, 2)
+        keys = (cells[:, 0] + CELL_BIAS) << 21 | (cells[:, 1] + CELL_BIAS)
+        order = np.argsort(keys, kind="stable")
+        rows, keys = rows[order], keys[order]
+        index = np.arange(n)
+
+        a, b = [], []
+        # même case (paires i < j), puis demi-voisinage: chaque paire de cases une fois
+        for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            target = keys + (dx << 21) + dy
+            hi = np.searchsorted(keys, target, "right")
+            lo = index + 1 if dx == dy == 0 else np.searchsorted(keys, target, "left")
+            counts = np.maximum(hi - lo, 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            a.append(rows[np.repeat(index, counts)])
+            b.append(rows[np.arange(total) + starts])
+        if not a:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(a), np.concatenate(b)
+
+    def positions(self, rows, now):
+        """Return x, y, vx, vy of the targets, dead reckoned to `now`."""
+        x, y, vx, vy, t = self.state[rows].T
+        dt = now - t
+        return x + vx * dt, y + vy * dt, vx, vy
+
+
+class Engine:
+    """Calcule le CPA/TCPA du bateau avec les cibles proches et, optionnellement, de toutes les paires de cibles.
+
+    Les rapports (trames AIS et RMC/GLL du bateau) sont intégrés au fil de l'eau, le calcul est fait
+    par lots au plus toutes les `interval` secondes du temps des trames.
+    """
+
+    def __init__(self, cpa_limit=CPA_LIMIT, tcpa_limit=TCPA_LIMIT, radius=RANGE, all_pairs=False, interval=INTERVAL):
+        self.cpa_limit = cpa_limit
+        self.tcpa_limit = tcpa_limit
+        self.radius = radius
+        self.all_pairs = all_pairs
+        self.interval = interval
+        self.traffic = Traffic(radius)
+        self.reassembler = Reassembler()
+        self.own = None  # x, y, vx, vy, horodatage
+        self.own_mmsi = None  # MMSI du transpondeur du bateau (!AIVDO)
+        self.velocity_time = None  # horodatage du dernier RMC avec SOG/COG
+        self.fix = None  # x, y, horodatage de la position d'où la vitesse est déduite sans RMC
+        self.computed = None
+        self.alerts = {}  # (mmsi, mmsi) → (cpa, tcpa); mmsi 0: le bateau
+
+    def own_ship(self, sentence):
+        position = sentence.position
+        if position is None:
+            return
+        if sentence.type == "RMC":
+            self.own_position(sentence.timestamp, *position, sentence.sog, sentence.cog)
+        else:
+            self.own_position(sentence.timestamp, *position, None, None)
+
+    def own_position(self, timestamp, lat, lon, sog, cog):
+        """Update the own ship from a fix (RMC, GLL, GGA or report of its transponder), SOG/COG if known."""
+        x, y = self.traffic.project(lat, lon)
+        if sog is not None and cog is not None:
+            v = sog * KNOT
+            vx, vy = v * math.sin(math.radians(cog)), v * math.cos(math.radians(cog))
+            self.velocity_time = timestamp
+        elif self.own is None:
+            vx = vy = 0.0
+        else:
+            # dernière vitesse connue: les trames d'un même datagramme ont le même horodatage
+            vx, vy = self.own[2], self.own[3]
+            if self.velocity_time is None or timestamp - self.velocity_time > VELOCITY_AGE:
+                # pas de RMC (ou de rapport du transpondeur) récent: vitesse déduite des positions successives, à au moins 1 s d'intervalle
+                fx, fy, ft = self.fix
+                dt = timestamp - ft
+                if dt >= 1:
+                    vx, vy = (x - fx) / dt, (y - fy) / dt
+        if self.fix is None or timestamp - self.fix[2] >= 1:
+            self.fix = (x, y, timestamp)
+        self.own = (x, y, vx, vy, timestamp)
+
+    def feed(self, sentence):
+        """Add a sentence. Return the alert changes if a computation is due, else None."""
+        if sentence.is_ais:
+            message = self.reassembler.add(sentence)
+            report = message and position_report(message[1][0])
+            if not report:
+                return None
+            mmsi, lon, lat, sog, cog = report
+            if abs(lat) > 90 or abs(lon) > 180:
+                return None
+            if sentence.type == "VDO":
+                # rapport du transpondeur du bateau: jamais une cible
+                if mmsi != self.own_mmsi:
+                    self.own_mmsi = mmsi
+                    self.traffic.remove(mmsi)
+                self.own_position(sentence.timestamp, lat, lon, sog, cog)
+            elif mmsi == self.own_mmsi:
+                return None
+            else:
+                self.traffic.update(mmsi, sentence.timestamp, lat, lon, sog, cog)
+        elif sentence.type in ("RMC", "GLL", "GGA"):
+            self.own_ship(sentence)
+        else:
+            return None
+
+        now = sentence.timestamp
+        if self.computed is not None and now - self.computed < self.interval:
+            return None
+        self.computed = now
+        return self.compute(now)
+
+    def compute(self, now):
+        """Compute CPA/TCPA at time `now`. Return `(new, ended)`: alerts started and ended since the last call."""
+        traffic = self.traffic
+        traffic.expire(now)
+        alerts = {}
+
+        if self.own is not None:
+            rows = traffic.near(self.own[0], self.own[1], self.radius)
+            if len(rows):
+                x, y, vx, vy = traffic.positions(rows, now)
+                ox, oy, ovx, ovy, t = self.own
+                dt = now - t
+                dx, dy = x - (ox + ovx * dt), y - (oy + ovy * dt)
+                cpa, tcpa = cpa_tcpa(dx, dy, vx - ovx, vy - ovy)
+                distance = np.hypot(dx, dy)
+                danger = (cpa < self.cpa_limit) & (tcpa < self.tcpa_limit) & (distance < self.radius)
+                for i in np.flatnonzero(danger):
+                    alerts[(0, int(traffic.mmsis[rows[i]]))] = (float(cpa[i]), float(tcpa[i]))
+
+        if self.all_pairs:
+            a, b = traffic.pairs()
+            if len(a):
+                xa, ya, vxa, vya = traffic.positions(a, now)
+                xb, yb, vxb, vyb = traffic.positions(b, now)
+                cpa, tcpa = cpa_tcpa(xb - xa, yb - ya, vxb - vxa, vyb - vya)
+                danger = (cpa < self.cpa_limit) & (tcpa < self.tcpa_limit)
+                for i in np.flatnonzero(danger):
+                    pair = sorted((int(traffic.mmsis[a[i]]), int(traffic.mmsis[b[i]])))
+                    alerts[tuple(pair)] = (float(cpa[i]), float(tcpa[i]))
+
+        new = {pair: alerts[pair] for pair in alerts.keys() - self.alerts.keys()}
+        ended = [pair for pair in self.alerts.keys() - alerts.keys()]
+        self.alerts = alerts
+        return new, ended
+
+
+def report(timestamp, changes):
+    if not changes:
+        return
+    new, ended = changes
+    timestamp = datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+    for (a, b), (cpa, tcpa) in sorted(new.items()):
+        who = f"{b}" if a == 0 else f"{a} / {b}"
+        print(f"{timestamp} ALERTE {who:<21} CPA {cpa / NM:5.2f} nm  TCPA {tcpa / 60:5.1f} min")
+    for a, b in sorted(ended):
+        who = f"{b}" if a == 0 else f"{a} / {b}"
+        print(f"{timestamp} fin    {who}")
+
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def datagram_received(self, data, addr):
+        now = time.time()
+        for line in data.splitlines():
+            if line:
+                report(now, self.engine.feed(Sentence(now, line)))
+
+
+@click.command(help="Calcule le risque de collision (CPA/TCPA) avec les cibles AIS")
+@click.option("--cpa", type=float, default=CPA_LIMIT / NM, show_default=True, help="CPA d'alerte (nm)")
+@click.option("--tcpa", type=float, default=TCPA_LIMIT / 60, show_default=True, help="TCPA d'alerte (min)")
+@click.option("--range", "radius", type=float, default=RANGE / NM, show_default=True, help="Portée (nm)")
+@click.option("-a", "--all-pairs", is_flag=True, help="Calcule aussi le CPA entre toutes les cibles proches")
+@click.option("-u", "--udp", "port", type=int, help="Écoute les trames sur ce port UDP (temps réel)")
+@click.argument("filenames", nargs=-1)
+def main(cpa, tcpa, radius, all_pairs, port, filenames):
+    engine = Engine(cpa * NM, tcpa * 60, radius * NM, all_pairs)
+
+    if port:
+
+        async def listen():
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: UdpProtocol(engine), local_addr=("0.0.0.0", port)
+            )
+            try:
+                await asyncio.Event().wait()
+            finally:
+                transport.close()
+
+        try:
+            asyncio.run(listen())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    t = time.perf_counter()
+    count = 0
+    for filename in filenames:
+        for sentence in read_sentences(filename):
+            count += 1
+            report(sentence.timestamp, engine.feed(sentence))
+    elapsed = time.perf_counter() - t
+    print(f"{count} trames en {elapsed:.1f} s, {len(engine.traffic.rows)} cibles suivies")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Diffusion des trames NMEA vers plusieurs destinations: UDP unicast/broadcast,
+# groupe multicast et clients TCP.
+
+import asyncio
+import logging
+import socket
+
+
+def parse_target(target, port):
+    """Return `(address, port)` from `host` or `host:port`."""
+    host, _, p = target.rpartition(":")
+    if not host:
+        host, p = p, port
+    if host == "<broadcast>":
+        return host, int(p)
+    return socket.gethostbyname(host), int(p)
+
+
+class TcpClient:
+    """Client TCP connecté, avec sa file d'attente bornée."""
+
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+        self.task = asyncio.current_task()
+
+    def send(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.writer.close()
+
+
+class Fanout:
+    """Envoie chaque datagramme à N destinations UDP, un groupe multicast et aux clients TCP connectés.
+
+    Les envois UDP sont non bloquants. Chaque client TCP a sa propre file bornée, vidée par
+    sa propre tâche: un client lent perd des trames (comptées) mais ne ralentit pas les autres.
+    """
+
+    def __init__(self, targets=(), multicast=None, ttl=1, tcp_port=None, queue_size=1000):
+        self.targets = list(targets)
+        self.tcp_port = tcp_port
+        self.queue_size = queue_size
+        self.clients = set()
+        self.server = None
+        self.dropped = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        if any(address == "<broadcast>" for address, _ in self.targets):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        if multicast:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            self.targets.append(multicast)
+
+    async def start(self):
+        if self.tcp_port:
+            self.server = await asyncio.start_server(self.connected, port=self.tcp_port)
+
+    async def connected(self, reader, writer):
+        client = TcpClient(writer, self.queue_size)
+        logging.info(f"client TCP {client.peer} connecté")
+        self.clients.add(client)
+        try:
+            await client.run()
+        finally:
+            self.clients.discard(client)
+            self.dropped += client.dropped
+            logging.info(f"client TCP {client.peer} déconnecté, {client.dropped} trames perdues")
+
+    def send(self, data):
+        for target in self.targets:
+            try:
+                self.sock.sendto(data, target)
+            except (BlockingIOError, ConnectionRefusedError):
+                self.dropped += 1
+        for client in self.clients:
+            client.send(data)
+
+    async def close(self):
+        for client in list(self.clients):
+            client.task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self.sock.close()
+
+    def report(self):
+        return f"{self.dropped + sum(client.dropped for client in self.clients)} trames perdues"
+
+    def counters(self):
+        dropped = self.dropped + sum(client.dropped for client in self.clients)
+        return {"clients": len(self.clients), "dropped": dropped}
@@ -2,54 +2,21 @@
 
 # NMEA reference: https://gpsd.gitlab.io/gpsd/NMEA.html
 
-import sys
 from pathlib import Path
 
 import click
-import simplekml
 
-
-def wgs84_angle(a, sign):
-    a = float(a)
-    a = round((a % 100) / 60 + a // 100, 6)
-    return -a if sign == "S" or sign == "W" else a
+from tracks import gps_track
 
 
 @click.command(help="Extrait la trace GPS d'une capture NMEA au format KML")
-@click.argument("filename")
+@click.option("--talker", help="talker ID du GPS (ex: GP, YD), par défaut tous")
+@click.option("--min-time", type=float, default=0, help="intervalle minimal entre deux points (s)")
+@click.option("--min-distance", type=float, default=0, help="distance minimale entre deux points (m)")
+@click.argument("filename", type=Path)
 @click.argument("output", default="")
-def main(filename, output):
-    filename = Path(filename)
-
-    if output == "-":
-        print("output to stdout", file=sys.stderr)
-    else:
-        if output == "":
-            output = Path(filename).with_suffix(".kml")
-        else:
-            output = Path(output)
-        print(f"output to {output}")
-
-    coords = []
-
-    for line in filename.open():
-        _, nmea = line.split(" ", 1)
-        if nmea.startswith("$YDGLL"):
-            f = nmea.split(",")
-            latitude = wgs84_angle(f[1], f[2])
-            longitune = wgs84_angle(f[3], f[4])
-            coords.append((longitune, latitude))
-
-    kml = simplekml.Kml(open=1)
-    linestring = kml.newlinestring(name=f"{filename.stem}")
-
-    linestring.coords = coords
-    linestring.altitudemode = simplekml.AltitudeMode.clamptoground
-
-    if output == "-":
-        kml.save("/dev/stdout")
-    else:
-        kml.save(output)
+def main(talker, min_time, min_distance, filename, output):
+    gps_track(".kml", filename, output, talker, min_time, min_distance)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+# Écriture bufferisée de documents JSON: un tableau JSON ou du NDJSON (un document par ligne).
+
+import json
+import sys
+
+
+def default(value):
+    """Serialize the values unknown to `json`: bytes (AIS binary payloads) as hex."""
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class JsonWriter:
+    """Écrit des documents dans un flux texte, sérialisés une seule fois et sans indentation.
+
+    Les documents sont accumulés et écrits par blocs de `buffer_size` caractères.
+    En mode tableau, chaque document est sur sa propre ligne, entre `[` et `]`.
+    """
+
+    def __init__(self, stream=None, ndjson=False, buffer_size=1 << 16):
+        self.stream = stream or sys.stdout
+        self.ndjson = ndjson
+        self.buffer_size = buffer_size
+        self.encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=default).encode
+        self.buffer = []
+        self.size = 0
+        self.count = 0
+        if not ndjson:
+            self.stream.write("[")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, document):
+        s = self.encode(document)
+        if self.ndjson:
+            s += "\n"
+        else:
+            s = ("\n" if self.count == 0 else ",\n") + s
+        self.count += 1
+        self.buffer.append(s)
+        self.size += len(s)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.write("".join(self.buffer))
+        self.buffer.clear()
+        self.size = 0
+
+    def close(self):
+        if self.buffer is None:
+            return
+        self.flush()
+        if not self.ndjson:
+            self.stream.write("\n]\n")
+        self.stream.flush()
+        self.buffer = None
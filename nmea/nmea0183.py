@@ -0,0 +1,285 @@
+# Décodage des trames NMEA 0183, partagé par les scripts.
+# NMEA reference: https://gpsd.gitlab.io/gpsd/NMEA.html
+
+from datetime import datetime
+from functools import reduce
+from operator import xor
+from pathlib import Path
+
+from nmealog import NmeaLog, is_nmealog, read_log
+
+KNOTS = {"N": 1.0, "K": 1 / 1.852, "M": 3600 / 1852}  # unités de vitesse → nœuds
+
+
+def xor_bytes(data):
+    """Return the XOR of all the bytes of `data`."""
+    return reduce(xor, data, 0)
+
+
+def nmea_checksum(sentence):
+    """Return the checksum of a sentence `$...*hh` (computed between `$` and `*`)."""
+    return xor_bytes(sentence[1 : sentence.rindex(b"*")])
+
+
+def wgs84_angle(a, sign):
+    a = float(a)
+    a = round((a % 100) / 60 + a // 100, 6)
+    return -a if sign == "S" or sign == "W" else a
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+class Sentence:
+    """Trame NMEA horodatée.
+
+    Seuls l'horodatage et les octets bruts sont conservés: les champs sont découpés
+    au premier accès, une seule fois, et les valeurs (position, vitesse, vent...)
+    sont décodées à la demande. Les propriétés valent None si la trame ne les porte pas.
+    """
+
+    __slots__ = ("timestamp", "raw", "_fields")
+
+    def __init__(self, timestamp, raw):
+        self.timestamp = timestamp
+        self.raw = raw
+        self._fields = None
+
+    def __repr__(self):
+        return f"Sentence({self.timestamp!r}, {self.raw!r})"
+
+    @property
+    def talker(self):
+        """Talker ID: `GP` for `$GPRMC`, `AI` for `!AIVDM`."""
+        return self.raw[1:3].decode()
+
+    @property
+    def type(self):
+        """Sentence type: `RMC` for `$GPRMC`, `VDM` for `!AIVDM`."""
+        return self.raw[3:6].decode()
+
+    @property
+    def tag(self):
+        """Address field: `$GPRMC`, `!AIVDM`."""
+        return self.raw[: self.raw.find(b",")].decode()
+
+    @property
+    def is_ais(self):
+        return self.raw[:1] == b"!"
+
+    @property
+    def fields(self):
+        """Fields of the sentence (strings), the address field being `fields[0]`."""
+        if self._fields is None:
+            star = self.raw.rfind(b"*")
+            self._fields = (self.raw if star < 0 else self.raw[:star]).decode(errors="replace").split(",")
+        return self._fields
+
+    def field(self, n):
+        fields = self.fields
+        return fields[n] if n < len(fields) else ""
+
+    @property
+    def valid(self):
+        """True if the checksum is present and correct."""
+        star = self.raw.rfind(b"*")
+        if star < 0:
+            return False
+        try:
+            return nmea_checksum(self.raw) == int(self.raw[star + 1 : star + 3], 16)
+        except ValueError:
+            return False
+
+    def _position(self, n):
+        lat, ns, lon, ew = self.field(n), self.field(n + 1), self.field(n + 2), self.field(n + 3)
+        if not lat or not lon:
+            return None
+        return wgs84_angle(lat, ns), wgs84_angle(lon, ew)
+
+    @property
+    def position(self):
+        """`(latitude, longitude)` in degrees, from GLL, RMC or GGA."""
+        type = self.type
+        if type == "GLL":
+            if self.field(6) == "V":  # données invalides
+                return None
+            return self._position(1)
+        if type == "RMC":
+            if self.field(2) == "V":
+                return None
+            return self._position(3)
+        if type == "GGA":
+            if self.field(6) == "0":  # pas de fix
+                return None
+            return self._position(2)
+        return None
+
+    @property
+    def lat(self):
+        position = self.position
+        return position and position[0]
+
+    @property
+    def lon(self):
+        position = self.position
+        return position and position[1]
+
+    @property
+    def time(self):
+        """UTC time of day `hhmmss.ss` as seconds since midnight, from GLL, RMC, GGA or ZDA."""
+        value = self.field(5 if self.type == "GLL" else 1)
+        if self.type not in ("GLL", "RMC", "GGA", "ZDA") or len(value) < 6:
+            return None
+        return int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+
+    @property
+    def datetime(self):
+        """UTC date and time, from RMC or ZDA."""
+        if self.type == "RMC":
+            d, t = self.field(9), self.field(1)
+            if len(d) != 6 or len(t) < 6:
+                return None
+            return datetime.strptime(d + t[:6], "%d%m%y%H%M%S").replace(microsecond=round(float(t[6:] or 0) * 1e6))
+        if self.type == "ZDA":
+            t = self.field(1)
+            if len(t) < 6 or not self.field(4):
+                return None
+            return datetime(
+                int(self.field(4)), int(self.field(3)), int(self.field(2)), int(t[:2]), int(t[2:4]), int(t[4:6])
+            ).replace(microsecond=round(float(t[6:] or 0) * 1e6))
+        return None
+
+    @property
+    def sog(self):
+        """Speed over ground in knots, from RMC or VTG."""
+        if self.type == "RMC":
+            return _float(self.field(7))
+        if self.type == "VTG":
+            return _float(self.field(5))
+        return None
+
+    @property
+    def cog(self):
+        """True course over ground in degrees, from RMC or VTG."""
+        if self.type == "RMC":
+            return _float(self.field(8))
+        if self.type == "VTG":
+            return _float(self.field(1))
+        return None
+
+    @property
+    def heading(self):
+        """Heading in degrees, from HDT, HDM or HDG (magnetic for the latter two)."""
+        if self.type in ("HDT", "HDM", "HDG"):
+            return _float(self.field(1))
+        return None
+
+    @property
+    def depth(self):
+        """Depth in meters, from DPT (below transducer), DBT or DBS."""
+        if self.type == "DPT":
+            return _float(self.field(1))
+        if self.type in ("DBT", "DBS"):
+            return _float(self.field(3))
+        return None
+
+    @property
+    def wind_angle(self):
+        """Wind angle in degrees, from MWV (relative or true, see `wind_reference`) or MWD (true direction)."""
+        if self.type == "MWV":
+            return _float(self.field(1))
+        if self.type == "MWD":
+            return _float(self.field(1))
+        return None
+
+    @property
+    def wind_reference(self):
+        """`R` (relative) or `T` (true) for MWV, `T` for MWD."""
+        if self.type == "MWV":
+            return self.field(2)
+        if self.type == "MWD":
+            return "T"
+        return None
+
+    @property
+    def wind_speed(self):
+        """Wind speed in knots, from MWV or MWD."""
+        if self.type == "MWV":
+            speed, unit = self.field(3), self.field(4)
+            return float(speed) * KNOTS.get(unit, 1.0) if speed else None
+        if self.type == "MWD":
+            return _float(self.field(5))
+        return None
+
+
+def parse_line(line):
+    """Return the `Sentence` of a `<isoformat> <sentence>` line of a `.txt` capture, None if the line is malformed."""
+    try:
+        timestamp, raw = line.rstrip().split(b" ", 1)
+        return Sentence(datetime.fromisoformat(timestamp.decode()).timestamp(), raw)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def read_sentences(filename, start=None, end=None, types=None):
+    """Yield the `Sentence` of a NMEA log (indexed container, `.txt` capture or pcap/pcapng),
+    in the time range [start, end[ and restricted to some sentence types if given."""
+    for timestamp, raw in read_log(filename, start, end, types):
+        yield Sentence(timestamp, raw)
+
+
+def complete_size(filename):
+    """Return the size of a `.txt` capture up to the end of its last complete line."""
+    with open(filename, "rb") as f:
+        end = f.seek(0, 2)
+        while end > 0:
+            n = min(end, 65536)
+            f.seek(end - n)
+            i = f.read(n).rfind(b"\n")
+            if i >= 0:
+                return end - n + i + 1
+            end -= n
+    return 0
+
+
+def chunks(filename, size, start=0, whole_lines=False):
+    """Split a capture into `(filename, start, end)` chunks of about `size` bytes.
+
+    `.txt` captures are split by byte ranges, indexed captures by record ranges,
+    from `start` (a byte offset or a record number). Other formats (pcap/pcapng) are read as a whole.
+    With `whole_lines`, a `.txt` capture stops at its last line ending: a line still being written is left out.
+    """
+    filename = str(filename)
+    if is_nmealog(filename):
+        with NmeaLog(filename) as log:
+            count = len(log)
+            per_chunk = max(1, count * size // max(log.end, 1))
+        return [(filename, i, min(i + per_chunk, count)) for i in range(start, count, per_chunk)]
+    if filename.endswith(".txt"):
+        length = complete_size(filename) if whole_lines else Path(filename).stat().st_size
+        return [(filename, i, min(i + size, length)) for i in range(start, length, size)]
+    return [(filename, None, None)]
+
+
+def read_chunk(filename, start, end=None):
+    """Yield the sentences of a chunk (up to the end of the capture if `end` is None).
+    A `.txt` chunk holds the lines starting in [start, end[."""
+    if start is None:
+        yield from read_sentences(filename)
+    elif is_nmealog(filename):
+        with NmeaLog(filename) as log:
+            for i in range(start, len(log) if end is None else end):
+                yield Sentence(*log.record(i))
+    else:
+        with open(filename, "rb") as f:
+            if start > 0:
+                f.seek(start - 1)
+                f.readline()  # la ligne à cheval appartient au morceau précédent
+            offset = f.tell()
+            for line in f:
+                if end is not None and offset >= end:
+                    break
+                offset += len(line)
+                if line.strip() and (sentence := parse_line(line)) is not None:
+                    yield sentence
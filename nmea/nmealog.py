@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+# Indexed binary container for NMEA captures: reader, writer and command line.
+# Layout: see container.py.
+
+import bisect
+import heapq
+import logging
+import mmap
+import struct
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+from container import MAGIC, RECORD, TRAILER, TRAILER_MAGIC, sentence_type, write_index
+from pcap import read_udp
+
+
+def is_nmealog(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class NmeaLogWriter:
+    """Write sentences into an indexed container. The index is kept in memory and written by `close()`."""
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.f = self.filename.open("wb")
+        self.f.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.timestamps = array("d")
+        self.offsets = array("Q")
+        self.types = defaultdict(lambda: array("I"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, timestamp, sentence):
+        """Append a sentence (bytes, without line ending)."""
+        self.types[sentence_type(sentence)].append(len(self.timestamps))
+        self.timestamps.append(timestamp)
+        self.offsets.append(self.offset)
+        self.f.write(RECORD.pack(timestamp, len(sentence)))
+        self.f.write(sentence)
+        self.offset += RECORD.size + len(sentence)
+
+    def close(self):
+        if self.f.closed:
+            return
+        write_index(self.f, self.offset, self.timestamps, self.offsets, self.types)
+        self.f.close()
+
+
+class NmeaLog:
+    """Read an indexed container. Time and sentence type lookups are binary searches in the index."""
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.file = self.filename.open("rb")
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        if self.buffer[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{self.filename}: not a NMEA log container")
+
+        if len(self.buffer) >= len(MAGIC) + TRAILER.size:
+            index_offset, magic = TRAILER.unpack_from(self.buffer, len(self.buffer) - TRAILER.size)
+        else:
+            magic = None
+        if magic == TRAILER_MAGIC and sys.byteorder == "little":
+            self._map_index(index_offset)
+            self.end = index_offset
+        else:
+            if magic != TRAILER_MAGIC:
+                logging.warning(f"{self.filename}: no index, scanning records")
+            self._scan_index()
+
+    def _map_index(self, offset):
+        buf = self.buffer
+        count = struct.unpack_from("<Q", buf, offset)[0]
+        offset += 8
+        self.timestamps = buf[offset : offset + count * 8].cast("d")
+        offset += count * 8
+        self.offsets = buf[offset : offset + count * 8].cast("Q")
+        offset += count * 8
+        ntypes = struct.unpack_from("<I", buf, offset)[0]
+        offset += 4
+        self.types = {}
+        for _ in range(ntypes):
+            type, n = struct.unpack_from("<3sxI", buf, offset)
+            offset += 8
+            self.types[type.rstrip(b"\0")] = buf[offset : offset + n * 4].cast("I")
+            offset += n * 4
+            offset += -offset % 8
+
+    def _scan_index(self):
+        buf = self.buffer
+        timestamps = array("d")
+        offsets = array("Q")
+        types = defaultdict(lambda: array("I"))
+
+        if len(buf) >= len(MAGIC) + TRAILER.size and buf[-8:] == TRAILER_MAGIC:
+            end = TRAILER.unpack_from(buf, len(buf) - TRAILER.size)[0]
+        else:
+            end = len(buf)
+
+        offset = len(MAGIC)
+        while offset + RECORD.size <= end:
+            timestamp, length = RECORD.unpack_from(buf, offset)
+            if offset + RECORD.size + length > end:
+                logging.warning(f"{self.filename}: truncated record at offset {offset}")
+                break
+            start = offset + RECORD.size
+            types[bytes(buf[start + 3 : start + 6])].append(len(timestamps))
+            timestamps.append(timestamp)
+            offsets.append(offset)
+            offset = start + length
+
+        self.timestamps = timestamps
+        self.offsets = offsets
+        self.types = dict(types)
+        self.end = offset
+
+    def close(self):
+        self.timestamps = self.offsets = self.types = None
+        self.buffer.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def record(self, i):
+        """Return the timestamp and the sentence (bytes) of record `i`."""
+        offset = self.offsets[i]
+        timestamp, length = RECORD.unpack_from(self.buffer, offset)
+        offset += RECORD.size
+        return timestamp, self.buffer[offset : offset + length].tobytes()
+
+    def bisect(self, timestamp):
+        """Return the number of the first record at or after `timestamp`."""
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def search(self, start=None, end=None, sentences=None):
+        """Yield `(timestamp, sentence)` of the records in [start, end[, restricted to some sentence types."""
+        timestamps = self.timestamps
+
+        if sentences is None:
+            lo = 0 if start is None else self.bisect(start)
+            hi = len(timestamps) if end is None else self.bisect(end)
+            records = range(lo, hi)
+        else:
+            ranges = []
+            for type in sentences:
+                if isinstance(type, str):
+                    type = type.encode()
+                indexes = self.types.get(type)
+                if indexes is None:
+                    continue
+                key = timestamps.__getitem__
+                lo = 0 if start is None else bisect.bisect_left(indexes, start, key=key)
+                hi = len(indexes) if end is None else bisect.bisect_left(indexes, end, key=key)
+                ranges.append(indexes[lo:hi])
+            records = heapq.merge(*ranges)
+
+        for i in records:
+            yield self.record(i)
+
+
+def read_log(filename, start=None, end=None, sentences=None):
+    """Yield `(timestamp, sentence)` from a NMEA log: indexed container, `.txt` capture or pcap/pcapng.
+
+    Timestamps are epoch seconds, sentences are bytes without line ending.
+    Only the container is searched by binary search, other formats are filtered while read.
+    """
+    if sentences is not None:
+        sentences = {s.encode() if isinstance(s, str) else s for s in sentences}
+
+    if is_nmealog(filename):
+        with NmeaLog(filename) as log:
+            yield from log.search(start, end, sentences)
+        return
+
+    def wanted(timestamp, sentence):
+        if start is not None and timestamp < start:
+            return False
+        if end is not None and timestamp >= end:
+            return False
+        return sentences is None or sentence_type(sentence) in sentences
+
+    if str(filename).endswith(".txt"):
+        for line in open(filename, "rb"):
+            timestamp, sentence = line.rstrip().split(b" ", 1)
+            timestamp = datetime.fromisoformat(timestamp.decode()).timestamp()
+            if wanted(timestamp, sentence):
+                yield timestamp, sentence
+    else:
+        for timestamp, payload in read_udp(filename, start=start, end=end):
+            for sentence in payload.splitlines():
+                if wanted(timestamp, sentence):
+                    yield timestamp, sentence
+
+
+@click.group(help="Capture NMEA indexée")
+def cli():
+    pass
+
+
+@cli.command(help="Convertit une capture .txt ou pcap/pcapng en capture indexée")
+@click.argument("filename", type=Path)
+@click.argument("output", default="")
+def convert(filename, output):
+    output = Path(output) if output else filename.with_suffix(".nmealog")
+    print(f"output to {output}")
+
+    with NmeaLogWriter(output) as writer:
+        for timestamp, sentence in read_log(filename):
+            writer.write(timestamp, sentence)
+
+    print(f"{len(writer.timestamps)} sentences")
+
+
+@cli.command(help="Écrit l'index d'une capture indexée interrompue")
+@click.argument("filename", type=Path)
+def index(filename):
+    with NmeaLog(filename) as log:
+        end = log.end
+        timestamps, offsets, types = array("d", log.timestamps), array("Q", log.offsets), log.types
+    with filename.open("r+b") as f:
+        write_index(f, end, timestamps, offsets, types)
+    print(f"{len(timestamps)} sentences indexed")
+
+
+@cli.command(help="Affiche le contenu d'une capture indexée")
+@click.argument("filename", type=Path)
+def info(filename):
+    with NmeaLog(filename) as log:
+        if len(log) == 0:
+            print("empty")
+            return
+        print(f"sentences: {len(log)}")
+        print(f"start:     {datetime.fromtimestamp(log.timestamps[0]).isoformat()}")
+        print(f"end:       {datetime.fromtimestamp(log.timestamps[-1]).isoformat()}")
+        for type, records in sorted(log.types.items()):
+            print(f"  {type.decode()}  {len(records):8}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,5 +1,7 @@
 #!/usr/bin/env bash
 
+./check_shared.sh || exit 1
+
 python3 -m venv venv
 source venv/bin/activate
 
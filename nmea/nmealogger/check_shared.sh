@@ -0,0 +1,15 @@
+#!/usr/bin/env bash
+
+# Modules partagés avec les scripts de nmea/: Briefcase n'embarque que le paquet de l'application
+# (src/nmealogger), ils y sont donc copiés et doivent rester identiques, octet pour octet.
+
+cd "$(dirname "$0")"
+
+status=0
+for module in container.py fanout.py; do
+    if ! cmp -s "../$module" "src/nmealogger/$module"; then
+        echo "src/nmealogger/$module diffère de nmea/$module: cp ../$module src/nmealogger/" >&2
+        status=1
+    fi
+done
+exit $status
@@ -2,72 +2,37 @@ import toga
 from toga.style import Pack
 from toga.constants import COLUMN
 import asyncio
-from datetime import datetime
 from pathlib import Path
-import json
 
+from nmealogger.protocol import NmeaProtocol
+from nmealogger.receiver import UdpReceiver
+from nmealogger.writer import RotatingWriter
 
-class NmeaProtocol(asyncio.DatagramProtocol):
-    def __init__(self):
-        super().__init__()
-        self.count = 0
-        self.last = []
-        self.size = 0
 
-    def connection_made(self, transport):
-        self.transport = transport
-
-        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        print("started", now)
-
-        self.filename = Path("/storage/emulated/0/Download") / Path(f"nmea_{now}.json")
-        if not self.filename.parent.is_dir():
-            self.filename = Path(f"nmea_{now}.json")
-
-        self.f = self.filename.open("w")
-        self.f.write("[\n")
-
-    def connection_lost(self, exc):
-        self.f.write("\n]\n")
-        self.f.close()
-
-    def datagram_received(self, data, addr):
-        # print(f"Received message: {data}")
-
-        if self.count != 0:
-            self.f.write(",\n")
-
-        frame = {"time": datetime.now().isoformat(), "data": data.decode()}
-        json.dump(frame, self.f)
-
-        lines = data.decode().splitlines()
-
-        self.last.extend(f"{n} {line}" for n, line in enumerate(lines, self.count + 1))
-        self.last = self.last[-30:]
-        self.count += len(lines)
-        self.size += len(data)
-
-    def info(self):
-        if self.count == 0:
-            return "No messages received yet"
-        else:
-            return f"Frame count: {self.count} size: {self.size}"
+def capture_directory():
+    directory = Path("/storage/emulated/0/Download")
+    return directory if directory.is_dir() else Path(".")
 
 
 class HandlerApp(toga.App):
     async def do_background_task(self, widget, **kwargs):
 
-        loop = asyncio.get_event_loop()
-
-        transport, protocol = await loop.create_datagram_endpoint(NmeaProtocol, local_addr=("0.0.0.0", 1456))
+        writer = RotatingWriter(capture_directory(), format="ndjson")
+        protocol = NmeaProtocol(writer)
+        receiver = UdpReceiver(protocol, 1456)
 
         while self.capturing:
-            self.label.text = protocol.info()
-            self.table.data = protocol.last
+            writer.tick()
+            self.label.text = f"{protocol.info()} - {receiver.info()}"
+            self.table.data = list(protocol.last)
             await asyncio.sleep(1)
 
-        transport.close()
-        self.label.text = f"Stopped - saved into {protocol.filename.stem}"
+        receiver.close()
+        writer.close()
+        if writer.filename is None:
+            self.label.text = "Stopped - nothing received"
+        else:
+            self.label.text = f"Stopped - saved into {writer.filename.stem} ({writer.files} files)"
         self.button.enabled = True
 
     def button_handler(self, widget):
@@ -0,0 +1,62 @@
+# Indexed binary container for NMEA captures (.nmealog).
+#
+# Layout (little endian):
+#   header   b"NMEALOG1"
+#   records  for each sentence: <d timestamp> <H length> sentence (without line ending)
+#   index    padding to 8 bytes
+#            <Q count>
+#            count × <d>  timestamps (epoch, seconds)
+#            count × <Q>  record offsets
+#            <I types>    number of sentence types
+#            per type: <3sxI type, n> then n × <I> record numbers, padded to 8 bytes
+#   trailer  <Q index offset> b"NMEAIDX1"
+#
+# A file without trailer (capture interrupted) is still readable: the index is
+# rebuilt in memory by a scan of the records, `nmealog.py index` writes it.
+#
+# nmealogger/src/nmealogger/container.py is a copy of this module, which must stay
+# identical (nmealogger/check_shared.sh): Briefcase only bundles the app package.
+
+import struct
+import sys
+from array import array
+
+MAGIC = b"NMEALOG1"
+TRAILER_MAGIC = b"NMEAIDX1"
+RECORD = struct.Struct("<dH")
+TRAILER = struct.Struct("<Q8s")
+
+
+def sentence_type(sentence):
+    """Return the sentence type of a NMEA sentence: `RMC` for `$GPRMC,...`, `VDM` for `!AIVDM,...`."""
+    return sentence[3:6]
+
+
+def write_index(f, offset, timestamps, offsets, types):
+    """Write the index and the trailer at `offset` of the file `f`."""
+
+    def pad(n):
+        f.write(bytes(-n % 8))
+        return n + -n % 8
+
+    if sys.byteorder != "little":
+        timestamps, offsets = array("d", timestamps), array("Q", offsets)
+        timestamps.byteswap()
+        offsets.byteswap()
+
+    f.seek(offset)
+    index_offset = pad(offset)
+    f.write(struct.pack("<Q", len(timestamps)))
+    f.write(timestamps.tobytes())
+    f.write(offsets.tobytes())
+    f.write(struct.pack("<I", len(types)))
+    size = 12 + len(timestamps) * 16
+    for type, records in sorted(types.items()):
+        f.write(struct.pack("<3sxI", type, len(records)))
+        if sys.byteorder != "little":
+            records = array("I", records)
+            records.byteswap()
+        f.write(records.tobytes())
+        size = pad(size + 8 + len(records) * 4)
+    f.write(TRAILER.pack(index_offset, TRAILER_MAGIC))
+    f.truncate()
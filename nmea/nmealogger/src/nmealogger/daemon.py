@@ -0,0 +1,201 @@
+"""Enregistreur NMEA sans interface: entrées UDP et série, capture indexée et rediffusion.
+
+python -m nmealogger.daemon -u 1456 -u 11101 -s /dev/ttyUSB0:4800 -d /var/log/nmea -p 127.0.0.1:10110 -t 10111
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from nmealogger.fanout import Fanout, parse_target
+from nmealogger.protocol import NmeaProtocol
+from nmealogger.receiver import UdpReceiver, serve_metrics
+from nmealogger.writer import FORMATS, RotatingWriter
+
+MAX_LINE = 4096  # au-delà, une ligne série sans fin de ligne est abandonnée
+RECONNECT = 5  # secondes entre deux tentatives d'ouverture d'un port série
+
+
+class Recorder:
+    """Writer commun aux entrées: chaque datagramme est écrit dans la capture puis rediffusé."""
+
+    def __init__(self, writer, publisher):
+        self.writer = writer
+        self.publisher = publisher
+
+    def write(self, timestamp, data):
+        self.writer.write(timestamp, data)
+        self.publisher.send(data)
+
+
+class SerialInput:
+    """Entrée série lue par la boucle asyncio (`add_reader`, POSIX): chaque ligne complète
+    est passée au protocole comme un datagramme, horodatée à la réception de sa fin de ligne.
+    Le port perdu (USB débranché) est rouvert toutes les `RECONNECT` secondes."""
+
+    def __init__(self, device, baudrate, protocol):
+        self.device = device
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self.serial = None
+        self.buffer = bytearray()
+        self.received = 0
+        self.bytes = 0
+        self.overruns = 0
+        self.reconnects = 0
+        self.lost = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        import serial
+
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self.serial = serial.Serial(self.device, baudrate=self.baudrate, timeout=0)
+            except (OSError, ValueError) as e:  # SerialException
+                logging.warning(f"{self.device}: {e}")
+                await asyncio.sleep(RECONNECT)
+                continue
+            logging.info(f"{self.device} ouvert")
+            self.lost.clear()
+            self.buffer.clear()
+            loop.add_reader(self.serial.fileno(), self.readable)
+            try:
+                await self.lost.wait()
+            finally:
+                self.release()
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT)
+
+    def readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except OSError as e:  # SerialException, ou EIO de l'ioctl de in_waiting quand l'USB est débranché
+            logging.warning(f"{self.device}: {e}")
+            self.release()  # sinon la boucle tourne sur le fd mort
+            self.lost.set()
+            return
+        if not data:
+            return
+        self.bytes += len(data)
+        self.buffer += data
+        end = self.buffer.rfind(b"\n")
+        if end >= 0:
+            lines = bytes(self.buffer[: end + 1])
+            del self.buffer[: end + 1]
+            self.received += 1
+            self.protocol.datagram_received(lines, self.device)
+        elif len(self.buffer) > MAX_LINE:
+            self.buffer.clear()
+            self.overruns += 1
+
+    def release(self):
+        if self.serial is not None:
+            asyncio.get_running_loop().remove_reader(self.serial.fileno())
+            self.serial.close()
+            self.serial = None
+
+    def close(self):
+        self.task.cancel()
+        self.release()
+
+    def counters(self):
+        return {
+            "received": self.received,
+            "bytes": self.bytes,
+            "overruns": self.overruns,
+            "reconnects": self.reconnects,
+        }
+
+
+async def run(args):
+    os.makedirs(args.directory, exist_ok=True)
+    writer = RotatingWriter(
+        args.directory,
+        format=args.format,
+        max_size=args.max_size * 1024 * 1024,
+        max_age=args.max_age,
+        flush_interval=args.flush,
+        fsync=args.fsync,
+    )
+    publisher = Fanout([parse_target(target, 10110) for target in args.publish], tcp_port=args.tcp)
+    await publisher.start()
+    recorder = Recorder(writer, publisher)
+
+    loop = asyncio.get_running_loop()
+    inputs = {}
+    for port in args.udp:
+        receiver = UdpReceiver(NmeaProtocol(recorder), port, args.bind, rcvbuf=args.rcvbuf * 1024)
+        if receiver.rcvbuf < args.rcvbuf * 1024:
+            logging.warning(f"udp:{port}: tampon de réception limité à {receiver.rcvbuf} octets (net.core.rmem_max)")
+        inputs[f"udp:{port}"] = receiver
+    for device in args.serial:
+        device, _, baudrate = device.partition(":")
+        inputs[device] = SerialInput(device, int(baudrate or 4800), NmeaProtocol(recorder))
+    logging.info(f"écoute {', '.join(inputs)}, capture dans {args.directory}")
+
+    metrics = None
+    if args.metrics:
+        metrics = await serve_metrics(args.metrics, {**inputs, "publish": publisher})
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    last_report = time.monotonic()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), 1)
+        except asyncio.TimeoutError:
+            pass
+        writer.tick()
+        if args.report and time.monotonic() - last_report >= args.report:
+            last_report = time.monotonic()
+            counts = ", ".join(f"{name}: {source.protocol.count}" for name, source in inputs.items())
+            received = sum(source.counters()["received"] for source in inputs.values())
+            dropped = sum(source.counters().get("dropped", 0) for source in inputs.values())
+            published = publisher.counters()
+            logging.info(
+                f"trames {counts}; {received} datagrammes reçus, {dropped} perdus à la réception; "
+                f"{published['clients']} clients TCP, {published['dropped']} trames perdues à la rediffusion"
+            )
+
+    if metrics:
+        metrics.close()
+    for source in inputs.values():
+        source.close()
+    writer.close()
+    await publisher.close()
+    logging.info(f"arrêt, {writer.files} fichiers écrits, dernier: {writer.filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enregistreur NMEA sans interface")
+    parser.add_argument("-u", "--udp", type=int, action="append", default=[], help="port UDP d'écoute (répétable)")
+    parser.add_argument("-s", "--serial", action="append", default=[], help="port série device[:baudrate]")
+    parser.add_argument("-b", "--bind", default="0.0.0.0", help="adresse d'écoute UDP")
+    parser.add_argument("--rcvbuf", type=int, default=4096, help="tampon de réception UDP (Ko)")
+    parser.add_argument("-m", "--metrics", type=int, help="port HTTP des compteurs (format Prometheus)")
+    parser.add_argument("-d", "--directory", default=".", help="répertoire des captures")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="binary", help="format des captures")
+    parser.add_argument("--max-size", type=int, default=64, help="taille maximale d'un fichier (Mo)")
+    parser.add_argument("--max-age", type=int, default=3600, help="durée maximale d'un fichier (s)")
+    parser.add_argument("--flush", type=float, default=5.0, help="intervalle maximal entre deux écritures (s)")
+    parser.add_argument("--fsync", action="store_true", help="fsync à chaque écriture")
+    parser.add_argument("-p", "--publish", action="append", default=[], help="rediffusion UDP host[:port]")
+    parser.add_argument("-t", "--tcp", type=int, help="port TCP des abonnés")
+    parser.add_argument("--report", type=float, default=60, help="intervalle des compteurs dans le journal (s)")
+    args = parser.parse_args()
+    if not args.udp and not args.serial:
+        args.udp = [1456]
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
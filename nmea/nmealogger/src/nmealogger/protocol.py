@@ -0,0 +1,35 @@
+import asyncio
+import time
+from collections import deque
+
+
+class NmeaProtocol(asyncio.DatagramProtocol):
+    """Réception des trames NMEA en UDP, horodatées à l'arrivée et passées à `writer.write(timestamp, data)`.
+
+    `last` garde les 30 dernières trames pour l'affichage. Le writer peut être partagé par
+    plusieurs entrées: c'est à son propriétaire de le fermer.
+    """
+
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+        self.count = 0
+        self.last = deque(maxlen=30)
+        self.size = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.writer.write(time.time(), data)
+
+        lines = data.decode(errors="replace").splitlines()
+        self.last.extend(f"{n} {line}" for n, line in enumerate(lines, self.count + 1))
+        self.count += len(lines)
+        self.size += len(data)
+
+    def info(self):
+        if self.count == 0:
+            return "No messages received yet"
+        else:
+            return f"Frame count: {self.count} size: {self.size}"
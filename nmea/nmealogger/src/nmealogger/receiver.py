@@ -0,0 +1,156 @@
+import asyncio
+import socket
+import struct
+import sys
+import time
+
+RCVBUF = 4 * 1024 * 1024  # tampon de réception demandé au noyau (Linux le double, borné par net.core.rmem_max)
+BATCH = 256  # datagrammes lus au plus par réveil de la boucle
+MAX_DATAGRAM = 65535
+
+# Linux: le nombre de datagrammes perdus faute de place dans le tampon de la socket est joint
+# aux datagrammes reçus (compteur cumulé depuis l'ouverture de la socket, connu au datagramme
+# qui suit les pertes)
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+OVFL = struct.Struct("=I")
+
+
+class UdpReceiver(asyncio.DatagramProtocol):
+    """Réception UDP par lots: à chaque réveil, la socket est vidée (jusqu'à `batch` datagrammes)
+    et chaque datagramme est passé à `protocol.datagram_received`.
+
+    Compteurs: datagrammes reçus, octets, datagrammes perdus par le noyau (SO_RXQ_OVFL, Linux),
+    datagrammes lus au dernier réveil et au plus (profondeur de la file de la socket).
+
+    Sans `add_reader` ni `recvmsg` (boucle Proactor de Windows), la socket est confiée à
+    `create_datagram_endpoint`: un datagramme par appel, sans compteur de pertes.
+    """
+
+    def __init__(self, protocol, port, bind="0.0.0.0", rcvbuf=RCVBUF, batch=BATCH):
+        self.protocol = protocol
+        self.port = port
+        self.batch = batch
+        self.received = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.wakeups = 0
+        self.started = time.monotonic()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if rcvbuf:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.rcvbuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.overflow = False
+        if SO_RXQ_OVFL is not None:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self.overflow = True
+            except OSError:
+                pass
+        self.sock.setblocking(False)
+        self.sock.bind((bind, port))
+        self.cmsg_size = socket.CMSG_SPACE(OVFL.size) if self.overflow else 0
+
+        self.loop = asyncio.get_running_loop()
+        self.endpoint = None
+        self.transport = None
+        self.closed = False
+        try:
+            if not hasattr(self.sock, "recvmsg"):
+                raise NotImplementedError
+            self.loop.add_reader(self.sock.fileno(), self.readable)
+        except NotImplementedError:
+            self.overflow = False
+            self.endpoint = self.loop.create_task(self.loop.create_datagram_endpoint(lambda: self, sock=self.sock))
+        protocol.connection_made(self)
+
+    def readable(self):
+        self.wakeups += 1
+        n = 0
+        recvmsg = self.sock.recvmsg
+        while n < self.batch:
+            try:
+                data, ancdata, _, addr = recvmsg(MAX_DATAGRAM, self.cmsg_size)
+            except OSError:  # BlockingIOError: socket vidée
+                break
+            n += 1
+            self.bytes += len(data)
+            for level, type, value in ancdata:
+                if level == socket.SOL_SOCKET and type == SO_RXQ_OVFL:
+                    self.dropped = OVFL.unpack_from(value)[0]
+            self.protocol.datagram_received(data, addr)
+        self.received += n
+        self.depth = n
+        self.max_depth = max(self.max_depth, n)
+
+    # asyncio.DatagramProtocol, sans add_reader
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.wakeups += 1
+        self.received += 1
+        self.bytes += len(data)
+        self.depth = self.max_depth = 1
+        self.protocol.datagram_received(data, addr)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.endpoint is None:
+            self.loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+        elif self.transport is None:
+            self.endpoint.cancel()
+            self.sock.close()
+        else:
+            self.transport.close()  # ferme la socket
+        self.protocol.connection_lost(None)
+
+    def counters(self):
+        """Return the counters as a dict."""
+        return {
+            "received": self.received,
+            "bytes": self.bytes,
+            "dropped": self.dropped,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "wakeups": self.wakeups,
+            "rcvbuf": self.rcvbuf,
+            "uptime": round(time.monotonic() - self.started, 3),
+        }
+
+    def info(self):
+        drops = f", {self.dropped} perdus" if self.overflow else ""
+        return f"{self.received} datagrammes{drops}, file max {self.max_depth}"
+
+
+async def serve_metrics(port, sources, bind="0.0.0.0"):
+    """Serve the counters of `sources` (dict name → object with `counters()`) over HTTP, Prometheus text format."""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = []
+        for name, source in sources.items():
+            for key, value in source.counters().items():
+                lines.append(f'nmea_{key}{{input="{name}"}} {value}')
+        body = ("\n".join(lines) + "\n").encode()
+        writer.write(
+            b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body)
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    return await asyncio.start_server(handle, bind, port)
@@ -0,0 +1,146 @@
+import json
+import os
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from nmealogger.container import MAGIC, RECORD, write_index
+
+FORMATS = {"ndjson": ".ndjson", "binary": ".nmealog"}
+
+
+class RotatingWriter:
+    """Écriture bufferisée des trames reçues, avec rotation des fichiers.
+
+    - `ndjson`: une ligne `{"time": ..., "data": ...}` par datagramme, chaque ligne est lisible seule
+    - `binary`: capture indexée de nmealog.py, un enregistrement par trame, l'index en fin de fichier
+
+    Les données sont gardées en mémoire jusqu'à `buffer_size` octets ou `flush_interval` secondes,
+    puis écrites; avec `fsync`, chaque écriture est suivie d'un fsync (sinon seulement à la rotation
+    et à la fermeture). Un nouveau fichier est commencé après `max_size` octets ou `max_age` secondes.
+    """
+
+    def __init__(
+        self,
+        directory=".",
+        format="ndjson",
+        max_size=64 * 1024 * 1024,
+        max_age=3600,
+        buffer_size=64 * 1024,
+        flush_interval=5.0,
+        fsync=False,
+        prefix="nmea",
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"unknown format {format!r}, use {', '.join(FORMATS)}")
+        self.directory = Path(directory)
+        self.format = format
+        self.max_size = max_size
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.prefix = prefix
+        self.buffer = bytearray()
+        self.f = None
+        self.filename = None
+        self.files = 0
+        self.opened = 0.0
+        self.flushed = 0.0
+        self.size = 0
+        self.timestamps = array("d")
+        self.offsets = array("Q")
+        self.types = defaultdict(lambda: array("I"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        filename = self.directory / f"{self.prefix}_{now}{FORMATS[self.format]}"
+        n = 1
+        while filename.exists():
+            filename = self.directory / f"{self.prefix}_{now}_{n}{FORMATS[self.format]}"
+            n += 1
+        self.filename = filename
+        self.f = filename.open("wb")
+        self.files += 1
+        self.opened = self.flushed = time.monotonic()
+        self.size = 0
+        if self.format == "binary":
+            self.buffer += MAGIC
+
+    def write(self, timestamp, data):
+        """Write a datagram received at `timestamp` (epoch seconds)."""
+        if self.f is None:
+            self.open()
+
+        if self.format == "ndjson":
+            frame = {"time": datetime.fromtimestamp(timestamp).isoformat(), "data": data.decode(errors="replace")}
+            self.buffer += json.dumps(frame).encode()
+            self.buffer += b"\n"
+        else:
+            offset = self.size + len(self.buffer)
+            for sentence in data.splitlines():
+                if sentence:
+                    self.types[sentence[3:6]].append(len(self.timestamps))
+                    self.timestamps.append(timestamp)
+                    self.offsets.append(offset)
+                    self.buffer += RECORD.pack(timestamp, len(sentence))
+                    self.buffer += sentence
+                    offset += RECORD.size + len(sentence)
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        """Flush the buffer and rotate the file if they are due; to be called periodically."""
+        if self.f is None:
+            return
+        now = time.monotonic()
+        if self.buffer and now - self.flushed >= self.flush_interval:
+            self.flush()
+        if self.size + len(self.buffer) >= self.max_size or now - self.opened >= self.max_age:
+            self.rotate()
+
+    def flush(self):
+        if self.f is None:
+            return
+        if self.buffer:
+            self.f.write(self.buffer)
+            self.size += len(self.buffer)
+            self.buffer.clear()
+        self.f.flush()
+        if self.fsync:
+            os.fsync(self.f.fileno())
+        self.flushed = time.monotonic()
+        if self.size >= self.max_size:
+            self.rotate()
+
+    def rotate(self):
+        """Close the current file; the next write opens a new one."""
+        if self.f is None:
+            return
+        f, self.f = self.f, None
+        if self.buffer:
+            f.write(self.buffer)
+            self.size += len(self.buffer)
+            self.buffer.clear()
+        if self.format == "binary":
+            write_index(f, self.size, self.timestamps, self.offsets, self.types)
+            self.timestamps = array("d")
+            self.offsets = array("Q")
+            self.types.clear()
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+    def close(self):
+        self.rotate()
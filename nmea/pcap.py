@@ -1,12 +1,72 @@
 #!/usr/bin/env python3
 
+import heapq
+import ipaddress
 import logging
+import mmap
+import os
 import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
 
 import click
 
+# pcapng block types
+SHB = 0x0A0D0D0A  # Section Header Block
+IDB = 0x00000001  # Interface Description Block
+SPB = 0x00000003  # Simple Packet Block
+ISB = 0x00000005  # Interface Statistics Block
+EPB = 0x00000006  # Enhanced Packet Block
+ISB_COUNTERS = {4: "ifrecv", 5: "ifdrop", 7: "osdrop"}
+DPEB = 0x80000001  # Darwin Process Event Block
+NRB = 0x00000004  # Name Resolution Block
+DSB = 0x0000000A  # Decryption Secrets Block
+BLOCK_TYPES = {SHB, IDB, SPB, ISB, EPB, DPEB, NRB, DSB, 0x00000BAD, 0x40000BAD}
+CONFIRM_BLOCKS = 4  # blocs valides consécutifs exigés pour une frontière de morceau
+
+# classic pcap magic numbers (as stored in the file) → byte order, timestamp ticks per second
+# https://tools.ietf.org/id/draft-gharris-opsawg-pcap-00.html
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1_000_000),
+    b"\xa1\xb2\xc3\xd4": (">", 1_000_000),
+    b"\x4d\x3c\xb2\xa1": ("<", 1_000_000_000),
+    b"\xa1\xb2\x3c\x4d": (">", 1_000_000_000),
+}
+
+
+# types de lien: https://www.tcpdump.org/linktypes.html
+LINKTYPE_NULL = 0  # loopback BSD: famille d'adresse sur 4 octets, dans l'ordre des octets de l'hôte
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101  # paquet IPv4 ou IPv6 sans en-tête de lien
+LINKTYPE_LOOP = 108  # loopback OpenBSD: famille d'adresse en ordre réseau
+LINKTYPE_LINUX_SLL = 113  # tcpdump -i any
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276  # tcpdump -i any, libpcap ≥ 1.10
+RAW_LINKTYPES = {LINKTYPE_RAW, 12, 14, LINKTYPE_IPV4, LINKTYPE_IPV6}  # 12, 14: DLT_RAW selon les systèmes
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = {0x8100, 0x88A8, 0x9100}  # 802.1Q, 802.1ad (QinQ)
+IP_VERSIONS = {4: ETHERTYPE_IPV4, 6: ETHERTYPE_IPV6}
+AF_INET6 = {10, 24, 28, 30}  # Linux, NetBSD/OpenBSD, FreeBSD, macOS
+IPV4_HEADER = struct.Struct(">B1xHHH1xB2x4s4s")
+IPV6_HEADER = struct.Struct(">4xHB1x16s16s")
+IPV6_EXTENSIONS = {0, 43, 44, 51, 60}  # hop-by-hop, routage, fragment, authentification, options destination
+IPPROTO_UDP = 17
+FRAGMENT_TIMEOUT = 30  # secondes (temps de la capture) pour recevoir tous les fragments d'un datagramme
+MAX_FRAGMENTED = 1024  # datagrammes en cours de réassemblage au plus
+NMEA_START = (b"$", b"!", b"\\")  # trame NMEA 0183, encapsulée (AIS), bloc d'étiquettes
+
+
+def debug_enabled():
+    """True when debug messages are logged: the debug strings and hex dumps are only built then."""
+    return logging.root.isEnabledFor(logging.DEBUG)
+
 
 def hexdump(data, print_function=print):
     """Hex dump."""
@@ -37,154 +97,862 @@ def ipv4_ntoa(data):
     return f"{a}.{b}.{c}.{d}"
 
 
-def parse_options(block):
+def ip_ntoa(data):
+    return ipv4_ntoa(data) if len(data) == 4 else str(ipaddress.IPv6Address(bytes(data)))
+
+
+def parse_options(block, endian="<"):
+    """Iterate over the options of a block. Values are memoryview slices of the block."""
     offset = 0
-    while offset < len(block):
-        option_type, option_length = struct.unpack("<HH", block[offset : 4 + offset])
+    fmt = endian + "HH"
+    while offset + 4 <= len(block):
+        option_type, option_length = struct.unpack_from(fmt, block, offset)
 
         value = block[offset + 4 : offset + 4 + option_length]
         if option_type == 0:
             value = "opt_endofopt"
         elif option_type == 1:
-            value = "opt_comment=" + value.decode()
-        # else:
-        #     value = block[offset + 4 : offset + 4 + option_length]
+            value = "opt_comment=" + str(value, "utf-8", "replace")
 
         yield option_type, option_length, value
+        if option_type == 0:
+            break
         offset += 4 + ((option_length + 3) // 4) * 4
 
 
 def parse_shb(block):
-    """Parse the Section Header Block (SHB).
+    """Parse the Section Header Block (SHB), return the byte order of the section.
     [reference](https://www.ietf.org/staging/draft-tuexen-opsawg-pcapng-02.html#name-section-header-block)
     """
-    byte_order, major, minor, length = struct.unpack("<IHHi", block[:12])
+    endian = "<" if block[:4] == b"\x4d\x3c\x2b\x1a" else ">"
+    byte_order, major, minor, length = struct.unpack_from(endian + "IHHq", block)
     logging.debug(f"0x0A0D0D0A SHB magic=0x{byte_order:08x}, version={major}.{minor}, section_length={length}")
     assert byte_order == 0x1A2B3C4D
-    for option_type, option_length, option_value in parse_options(block[16:]):
+    for option_type, option_length, option_value in parse_options(block[16:], endian):
         logging.debug(f"    SHB option type={option_type}, length={option_length}, {option_value}")
+    return endian
 
 
-def parse_idb(block):
-    """Parse an Interface Description Block (IDB).
+def parse_idb(block, endian="<"):
+    """Parse an Interface Description Block (IDB), return the link type and the timestamp ticks per second.
     [reference](https://www.ietf.org/staging/draft-tuexen-opsawg-pcapng-02.html#name-interface-description-block)
     """
-    link_type, _, snap_len = struct.unpack("<HHI", block[:8])
-    logging.debug(f"0x00000001 IDB link_type={link_type}, snap_len={snap_len}")
-    for option_type, option_length, option_value in parse_options(block[8:]):
+    link_type, _, snap_len = struct.unpack_from(endian + "HHI", block)
+    debug = debug_enabled()
+    if debug:
+        logging.debug(f"0x00000001 IDB link_type={link_type}, snap_len={snap_len}")
+    resolution = 1_000_000
+    for option_type, option_length, option_value in parse_options(block[8:], endian):
         if option_type == 2:
-            option_value = f"if_name={option_value.decode('utf-8')}"
-        logging.debug(f"    IDB option type={option_type}, length={option_length}, {option_value}")
-    hexdump(block, logging.debug)
-
-
-def parse_epb(block):
-    """Parse an Enhanced Packet Block (EPB).
+            option_value = f"if_name={str(option_value, 'utf-8', 'replace')}"
+        elif option_type == 9:  # if_tsresol
+            tsresol = option_value[0]
+            resolution = 2 ** (tsresol & 0x7F) if tsresol & 0x80 else 10**tsresol
+            option_value = f"if_tsresol={tsresol}"
+        if debug:
+            logging.debug(f"    IDB option type={option_type}, length={option_length}, {option_value}")
+    if debug:
+        hexdump(block, logging.debug)
+    return link_type, resolution
+
+
+def parse_epb(block, endian="<"):
+    """Parse an Enhanced Packet Block (EPB), return the interface id, the raw timestamp and the packet data.
     [reference](https://www.ietf.org/staging/draft-tuexen-opsawg-pcapng-02.html#name-enhanced-packet-block)"""
 
-    interface_id, timestamp_high, timestamp_low, cap_len, pkt_len = struct.unpack("<IIIII", block[:20])
+    interface_id, timestamp_high, timestamp_low, cap_len, pkt_len = struct.unpack_from(endian + "IIIII", block)
 
     timestamp = (timestamp_high << 32) + timestamp_low
-    timestamp = datetime.fromtimestamp(timestamp / 1000000).isoformat()
-
-    logging.debug(
-        f"0x00000006 EPB interface_id={interface_id}, timestamp={timestamp}, cap_len={cap_len}, pkt_len={pkt_len}"
-    )
     data = block[20 : 20 + cap_len]
-    offset = 20 + ((cap_len + 3) // 4) * 4
-    for option_type, option_length, option_value in parse_options(block[offset:]):
-        logging.debug(f"    EPB option {option_type} {option_value}")
-    hexdump(data, logging.debug)
-
-    mac_dest, mac_src, proto = struct.unpack(">6s6sH", data[:14])
-    logging.debug(f"    MAC {eth_ntoa(mac_src)} → {eth_ntoa(mac_dest)} proto {proto:04x}")
 
-    if proto == 0x0800:
-        ip_header = struct.unpack(">BBHHHBBH4s4s", data[14:34])
-        assert ip_header[0] // 16 == 0x4  # IPv4 header
+    if debug_enabled():
+        logging.debug(
+            f"0x00000006 EPB interface_id={interface_id}, timestamp={timestamp}, cap_len={cap_len}, pkt_len={pkt_len}"
+        )
+        offset = 20 + ((cap_len + 3) // 4) * 4
+        for option_type, option_length, option_value in parse_options(block[offset:], endian):
+            logging.debug(f"    EPB option {option_type} {option_value}")
+        hexdump(data, logging.debug)
 
-        if ip_header[6] == 17:  # IPPROTO_UDP
-            assert ip_header[0] == 0x45  # IP header sans extension, 20 octets
-
-            saddr = ipv4_ntoa(ip_header[8])
-            daddr = ipv4_ntoa(ip_header[9])
-
-            sport, dport, length, checksum = struct.unpack(">HHHH", data[34:42])
-            if sport == 11101:
-                logging.debug(f"    UDP {saddr}:{sport} → {daddr}:{dport} length {length}")
-                for line in data[42 : 42 + length - 8].decode().splitlines():
-                    print(timestamp, line)
-                return
+    return interface_id, timestamp, data
 
-    # print(f"{timestamp} skip")
 
-
-def parse_dpeb(block):
+def parse_dpeb(block, endian="<"):
     """Darwin Process Event Block.
     [reference](https://github.com/wireshark/wireshark/blob/master/epan/dissectors/file-pcapng.c#L273)
     """
 
+    if not debug_enabled():
+        return
     logging.debug("DPEB")
     hexdump(block, logging.debug)
 
-    process_id = struct.unpack("<I", block[:4])[0]
+    process_id = struct.unpack_from(endian + "I", block)[0]
     logging.debug(f"    process_id={process_id}")
-    for option_type, option_length, option_value in parse_options(block[4:]):
+    for option_type, option_length, option_value in parse_options(block[4:], endian):
         if option_type == 2:
-            option_value = f"darwin_proc_name={option_value.decode('utf-8')}"
+            option_value = f"darwin_proc_name={str(option_value, 'utf-8', 'replace')}"
         elif option_type == 4:
             assert option_length == 16
             option_value = f"darwin_proc_uuid={option_value.hex()}"
         logging.debug(f"    DPEB type={option_type}, length={option_length}, {option_value}")
 
 
-@click.command(help="Extrait les trames UDP port 11101 d'une capture (Python version)")
-@click.argument("filename")
-@click.argument("output", default="")
-def main(filename, output):
-    p = Path(filename).open("rb")
-
-    magic = p.read(4)
-    p.seek(0)
-    magic = struct.unpack("I", magic)[0]
-    if magic == 0xA0D0D0A:
-        # https://www.ietf.org/staging/draft-tuexen-opsawg-pcapng-02.html
-        logging.debug("pcapng file")
+def network_layer(data, link_type):
+    """Return `(ethertype, offset)` of the network packet carried by a frame of `link_type`, or None."""
+    size = len(data)
+    if link_type == LINKTYPE_ETHERNET:
+        if size < 14:
+            return None
+        ethertype, offset = (data[12] << 8) | data[13], 14
+    elif link_type == LINKTYPE_LINUX_SLL:
+        if size < 16:
+            return None
+        ethertype, offset = (data[14] << 8) | data[15], 16
+    elif link_type == LINKTYPE_LINUX_SLL2:
+        if size < 20:
+            return None
+        ethertype, offset = (data[0] << 8) | data[1], 20
+    elif link_type in RAW_LINKTYPES:
+        if size < 1:
+            return None
+        return IP_VERSIONS.get(data[0] >> 4), 0
+    elif link_type == LINKTYPE_NULL or link_type == LINKTYPE_LOOP:
+        if size < 4:
+            return None
+        family = data[0] | data[3]  # famille < 256: un seul octet non nul, quel que soit l'ordre des octets
+        return ETHERTYPE_IPV4 if family == 2 else ETHERTYPE_IPV6 if family in AF_INET6 else None, 4
     else:
-        # https://tools.ietf.org/id/draft-gharris-opsawg-pcap-00.html
-        logging.error(f"pcap file (magic 0x{magic:04x})")
-        exit(2)
+        return None
 
-    while True:
-        block_header = p.read(8)
-        if block_header is None or len(block_header) == 0:
-            break
-        block_type, block_length = struct.unpack("II", block_header)
-        assert block_length % 4 == 0
+    while ethertype in ETHERTYPE_VLAN and size >= offset + 4:
+        ethertype, offset = (data[offset + 2] << 8) | data[offset + 3], offset + 4
+    return ethertype, offset
 
-        block = p.read(block_length - 12)
-        block_length2 = struct.unpack("I", p.read(4))[0]
-        assert block_length == block_length2
 
-        if block_type == 0x0A0D0D0A:  # Section Header Block (SHB)
-            parse_shb(block)
-        elif block_type == 0x00000001:  # Interface Description Block (IDB)
-            parse_idb(block)
+def ip_packet(data, link_type):
+    """Decode the IPv4 or IPv6 packet carried by a frame of `link_type`.
 
-        elif block_type == 0x00000006:  # Enhanced Packet Block (EPB)
-            parse_epb(block)
+    Return `(src, dst, proto, fragment, payload)`, the addresses as bytes, `fragment` being None
+    for an unfragmented packet, else `(identification, offset, more fragments)`. Return None if the
+    frame does not carry an IP packet.
+    """
+    layer = network_layer(data, link_type)
+    if layer is None:
+        return None
+    ethertype, offset = layer
+
+    if ethertype == ETHERTYPE_IPV4:
+        if len(data) < offset + 20:
+            return None
+        version_ihl, total_length, ident, frag, proto, src, dst = IPV4_HEADER.unpack_from(data, offset)
+        ihl = (version_ihl & 0x0F) * 4
+        if version_ihl >> 4 != 4 or ihl < 20:
+            return None
+        end = offset + total_length if total_length else len(data)  # 0: segmentation par la carte réseau
+        fragment = (ident, (frag & 0x1FFF) * 8, frag & 0x2000) if frag & 0x3FFF else None
+        return src, dst, proto, fragment, data[offset + ihl : end]
+
+    if ethertype == ETHERTYPE_IPV6:
+        if len(data) < offset + 40:
+            return None
+        payload_length, proto, src, dst = IPV6_HEADER.unpack_from(data, offset)
+        end = offset + 40 + payload_length if payload_length else len(data)  # 0: jumbogramme
+        offset += 40
+        fragment = None
+        while proto in IPV6_EXTENSIONS:
+            if len(data) < offset + 8:
+                return None
+            if proto == 44:  # fragment
+                frag, ident = struct.unpack_from(">2xHI", data, offset)
+                fragment = (ident, frag & 0xFFF8, frag & 1)
+                length = 8
+            elif proto == 51:  # authentification
+                length = (data[offset + 1] + 2) * 4
+            else:
+                length = (data[offset + 1] + 1) * 8
+            proto = data[offset]
+            offset += length
+        return src, dst, proto, fragment, data[offset:end]
+
+    return None
+
+
+class Reassembler:
+    """Réassemblage des datagrammes IP fragmentés (IPv4 et IPv6), par (source, destination, identification, protocole).
+
+    Un datagramme dont les fragments ne sont pas tous arrivés `timeout` secondes (temps de la capture)
+    après le premier est abandonné, comme les plus anciens au-delà de `max_pending` datagrammes incomplets.
+    """
 
-        elif block_type == 0x80000001:  # Darwin Process Event Block (DPEB)
-            # parse_dpeb(block)
-            pass
+    def __init__(self, timeout=FRAGMENT_TIMEOUT, max_pending=MAX_FRAGMENTED):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = {}  # clé → [timestamp du premier fragment, {offset: (timestamp, more, données)}, longueur totale]
+        self.reassembled = 0
+        self.expired = 0
+
+    def add(self, key, timestamp, offset, more, data):
+        """Add a fragment. Return the payload of the datagram once complete, else None."""
+        entry = self.pending.get(key)
+        if entry is None:
+            self.expire(timestamp)
+            entry = self.pending[key] = [timestamp, {}, None]
+        fragments = entry[1]
+        fragments[offset] = (timestamp, more, bytes(data))
+        if not more:
+            entry[2] = offset + len(data)
+        if entry[2] is None:
+            return None
+
+        parts = []
+        size = 0
+        for start in sorted(fragments):
+            if start > size:
+                return None  # il manque un fragment
+            piece = fragments[start][2]
+            if start + len(piece) > size:
+                parts.append(piece[size - start :])
+                size = start + len(piece)
+        if size < entry[2]:
+            return None
+        del self.pending[key]
+        self.reassembled += 1
+        return b"".join(parts)[: entry[2]]
+
+    def unfinished(self):
+        """Return the fragments of the incomplete datagrams as `(key, timestamp, offset, more, data)`,
+        in the order they were read (see `add`)."""
+        fragments = [
+            (key, timestamp, offset, more, data)
+            for key, entry in self.pending.items()
+            for offset, (timestamp, more, data) in entry[1].items()
+        ]
+        return sorted(fragments, key=itemgetter(1))
+
+    def expire(self, now):
+        """Drop the incomplete datagrams started more than `timeout` seconds before `now`,
+        and the oldest ones to make room for a new one."""
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if now - entry[0] <= self.timeout and len(self.pending) < self.max_pending:
+                break
+            del self.pending[key]
+            self.expired += 1
+
+
+class UdpDecoder:
+    """Décodage des datagrammes UDP, quels que soient le type de lien et la couche IP (voir `ip_packet`),
+    les datagrammes fragmentés étant réassemblés.
+
+    `decode` rend `(src, sport, dst, dport, payload)`, les adresses en octets, ou None pour un paquet
+    qui n'est pas (encore) un datagramme UDP complet, ou que `packet_filter` rejette.
+    """
 
-        elif block_type == 0x00000005:  # Interface Statistics Block (ISB)
-            pass
+    def __init__(self, packet_filter=None):
+        self.packet_filter = packet_filter
+        self.fragments = Reassembler()
+
+    def decode(self, data, link_type, timestamp):
+        packet = ip_packet(data, link_type)
+        if packet is None:
+            return None
+        src, dst, proto, fragment, payload = packet
+        if proto != IPPROTO_UDP:
+            return None
+        if fragment is not None:
+            ident, offset, more = fragment
+            return self.fragment((src, dst, ident, proto), timestamp, offset, more, payload)
+        return self.udp(src, dst, payload)
+
+    def fragment(self, key, timestamp, offset, more, data):
+        """Add a fragment of a UDP datagram (see `Reassembler.add`), decode the datagram once complete."""
+        payload = self.fragments.add(key, timestamp, offset, more, data)
+        return None if payload is None else self.udp(key[0], key[1], payload)
+
+    def udp(self, src, dst, payload):
+        if len(payload) < 8:
+            return None
+
+        sport, dport, length = struct.unpack_from(">HHH", payload)
+        if self.packet_filter is not None and not self.packet_filter.accept(src, sport, dst, dport):
+            return None
+        if debug_enabled():
+            logging.debug(f"    UDP {ip_ntoa(src)}:{sport} → {ip_ntoa(dst)}:{dport} length {length}")
+        return src, sport, dst, dport, payload[8:length] if length >= 8 else payload[8:]
+
+
+class PacketFilter:
+    """Filtre de paquets compilé, vérifié sur le tampon de la capture avant tout découpage ou décodage.
+
+    Les conditions (ports, adresses, protocole) portent sur les en-têtes Ethernet/IPv4/UDP ou TCP,
+    lus en un seul `unpack_from` à leurs positions fixes et testés par une fonction générée à la
+    construction du filtre. Seuls les paquets dont on est sûr qu'ils ne conviennent pas sont rejetés:
+    les trames VLAN, IPv6, les en-têtes IPv4 avec options, les fragments et les autres types de lien
+    passent, et sont vérifiés par `accept` une fois décodés (`UdpDecoder`).
+    Intervalle de temps: [start, end[, en secondes epoch.
+    """
+
+    # ethertype, version/IHL, fragment, protocole, adresse source, adresse destination, port source, port destination
+    HEADERS = struct.Struct(">12xHB5xHxB2xIIHH")
+    PROTOCOLS = {"udp": 17, "tcp": 6}
+
+    def __init__(self, sport=None, dport=None, src=None, dst=None, proto=None, start=None, end=None):
+        self.args = (sport, dport, src, dst, proto, start, end)
+        self.start = start
+        self.end = end
+        self.sport = sport
+        self.dport = dport
+        self.src = src and ipaddress.ip_address(src).packed
+        self.dst = dst and ipaddress.ip_address(dst).packed
+
+        checks = []
+        if (sport is not None or dport is not None) and proto is None:
+            proto = "udp"
+        if proto is not None:
+            proto = self.PROTOCOLS.get(proto, proto)
+            checks.append(f"t[3] == {int(proto)}")
+        for i, address in ((4, self.src), (5, self.dst)):
+            if address is not None:
+                checks.append(f"t[{i}] == {int.from_bytes(address, 'big')}" if len(address) == 4 else "False")
+        ports = []
+        if sport is not None:
+            ports.append(f"t[6] == {int(sport)}")
+        if dport is not None:
+            ports.append(f"t[7] == {int(dport)}")
+        if ports:
+            # en-tête IPv4 avec options ou fragment: les ports ne sont connus qu'après décodage
+            checks.append(f"(t[1] != 0x45 or t[2] & 0x3FFF or {' and '.join(ports)})")
+        passthrough = ", ".join(f"0x{ethertype:04X}" for ethertype in (ETHERTYPE_IPV6, *sorted(ETHERTYPE_VLAN)))
+        self.source = f"t[0] == 0x0800 and {' and '.join(checks)} or t[0] in ({passthrough})" if checks else None
+        self.headers = eval(f"lambda t: {self.source}") if checks else None
+
+    def __reduce__(self):
+        return PacketFilter, self.args  # la fonction générée est recompilée dans le processus qui reçoit le filtre
+
+    def __repr__(self):
+        return f"PacketFilter({self.source!r}, start={self.start!r}, end={self.end!r})"
+
+    def match(self, buf, offset, length, timestamp, link_type=LINKTYPE_ETHERNET):
+        """Test the packet of `length` bytes at `offset` of `buf` captured at `timestamp`."""
+        if self.start is not None and timestamp < self.start:
+            return False
+        if self.end is not None and timestamp >= self.end:
+            return False
+        if self.headers is None or link_type != LINKTYPE_ETHERNET:
+            return True
+        if length < self.HEADERS.size:
+            return True  # dernier fragment d'un datagramme IP, par exemple: décidé au décodage
+        return self.headers(self.HEADERS.unpack_from(buf, offset))
+
+    def accept(self, src, sport, dst, dport):
+        """Test the addresses (bytes) and ports of a decoded UDP datagram."""
+        return (
+            (self.sport is None or sport == self.sport)
+            and (self.dport is None or dport == self.dport)
+            and (self.src is None or src == self.src)
+            and (self.dst is None or dst == self.dst)
+        )
+
+
+def dropped_packets(statistics):
+    """Return the number of packets dropped during the capture from the ISB counters (see `PcapReader.statistics`)."""
+    return sum(c.get("ifdrop", 0) + c.get("osdrop", 0) for c in statistics.values())
+
+
+def parse_isb(block, endian="<"):
+    """Parse an Interface Statistics Block (ISB), return the interface id and the counters it gives
+    among `ifrecv`, `ifdrop` (dropped by the interface) and `osdrop` (dropped by the capture).
+    [reference](https://www.ietf.org/staging/draft-tuexen-opsawg-pcapng-02.html#name-interface-statistics-block)
+    """
+    interface_id = struct.unpack_from(endian + "I", block)[0]
+    counters = {}
+    for option_type, option_length, option_value in parse_options(block[12:], endian):
+        name = ISB_COUNTERS.get(option_type)
+        if name and option_length == 8:
+            counters[name] = struct.unpack_from(endian + "Q", option_value)[0]
+    logging.debug(f"0x00000005 ISB interface_id={interface_id}, {counters}")
+    return interface_id, counters
+
+
+class PcapReader:
+    """Streaming reader for pcapng and classic pcap captures.
+
+    The file is memory-mapped and walked with `struct.unpack_from`: packet data are
+    memoryview slices of the mapping, no copy is made. A slice is only valid until
+    the next packet is read, use `bytes(data)` to keep it.
+
+    `sections` lists the sections met so far as `[offset, byte order, interfaces]`,
+    each interface being `[link_type, ticks per second, offset of the IDB]`. It can be
+    saved and restored to resume reading at a given packet offset without rescanning.
+
+    `statistics` gives the last counters of the Interface Statistics Blocks met,
+    by `(section offset, interface id)`: packets received and dropped during the capture.
+    """
 
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.file = self.filename.open("rb")
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self.file.close()
+            raise ValueError(f"{self.filename}: empty file")
+        self.buffer = memoryview(self.mmap)
+
+        magic = bytes(self.buffer[:4])
+        if magic == b"\x0a\x0d\x0d\x0a":
+            # https://www.ietf.org/staging/draft-tuexen-opsawg-pcapng-02.html
+            logging.debug("pcapng file")
+            self.format = "pcapng"
+            self.endian = "<"
+            self.interfaces = []
+            self.sections = []
+            self.statistics = {}
+        elif magic in PCAP_MAGICS:
+            # https://tools.ietf.org/id/draft-gharris-opsawg-pcap-00.html
+            self.format = "pcap"
+            self.endian, resolution = PCAP_MAGICS[magic]
+            _, major, minor, _, _, snap_len, link_type = struct.unpack_from(self.endian + "IHHiIII", self.buffer)
+            logging.debug(f"pcap file version={major}.{minor}, snap_len={snap_len}, link_type={link_type}")
+            self.interfaces = [[link_type & 0xFFFF, resolution, 0]]
+            self.sections = [[0, self.endian, self.interfaces]]
+            self.statistics = {}
         else:
-            logging.error(f"0x{block_type:08x} UNKNOWN BLOCK TYPE length: {block_length}")
-            hexdump(block, logging.error)
-            break
+            self.close()
+            raise ValueError(f"{self.filename}: unknown capture format (magic 0x{magic.hex()})")
+
+    def close(self):
+        self.buffer.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            # some packet slices are still referenced: the mapping is released with them
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return self.packets()
+
+    def dropped(self):
+        """Return the number of packets dropped during the capture, from the statistics read so far."""
+        return dropped_packets(self.statistics)
+
+    def packets(self, offset=None, packet_filter=None, end=None):
+        """Yield `(offset, timestamp, link_type, data)` for each packet of the capture,
+        starting at `offset` if given (the offset of a packet previously yielded) up to `end`.
+        With a `PacketFilter`, the packets it rejects are skipped before being sliced."""
+        if self.format == "pcapng":
+            return self._pcapng_packets(offset, packet_filter, end)
+        return self._pcap_packets(offset, packet_filter, end)
+
+    def _pcap_packets(self, offset, packet_filter=None, end=None):
+        buf = self.buffer
+        size = len(buf) if end is None else end
+        fmt = self.endian + "IIII"
+        link_type, resolution, _ = self.interfaces[0]
+
+        if not offset:
+            offset = 24
+        while offset + 16 <= size:
+            ts_sec, ts_frac, incl_len, _ = struct.unpack_from(fmt, buf, offset)
+            if offset + 16 + incl_len > size:
+                logging.warning(f"truncated packet at offset {offset}")
+                break
+            timestamp = ts_sec + ts_frac / resolution
+            if packet_filter is None or packet_filter.match(buf, offset + 16, incl_len, timestamp, link_type):
+                yield offset, timestamp, link_type, buf[offset + 16 : offset + 16 + incl_len]
+            offset += 16 + incl_len
+
+    def _pcapng_packets(self, offset, packet_filter=None, end=None):
+        if not offset:
+            offset = 0
+        elif self.sections and self.sections[0][0] <= offset:
+            # restore the section the offset belongs to
+            _, self.endian, self.interfaces = max((s for s in self.sections if s[0] <= offset), key=itemgetter(0))
+        else:
+            # unknown sections: scan the blocks that come before the offset
+            for _ in self._pcapng_blocks(0, offset):
+                pass
+
+        for pos, block_type, block in self._pcapng_blocks(offset, end, packet_filter):
+            if block_type == EPB:
+                interface_id, timestamp, data = parse_epb(block, self.endian)
+                link_type, resolution, _ = self.interfaces[interface_id]
+                yield pos, timestamp / resolution, link_type, data
+
+    def _pcapng_blocks(self, offset, end=None, packet_filter=None):
+        """Walk the blocks from `offset` to `end`, keep track of the sections and interfaces,
+        yield `(offset, block_type, block)` for the other blocks, but the packets rejected by `packet_filter`."""
+        buf = self.buffer
+        size = len(buf) if end is None else end
+
+        while offset + 12 <= size:
+            if buf[offset : offset + 4] == b"\x0a\x0d\x0d\x0a":
+                # the byte order of the section is given by the byte-order magic of the SHB
+                self.endian = "<" if buf[offset + 8 : offset + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+
+            block_type, block_length = struct.unpack_from(self.endian + "II", buf, offset)
+            if block_length < 12 or block_length % 4 != 0:
+                raise ValueError(f"{self.filename}: invalid block length {block_length} at offset {offset}")
+            if offset + block_length > size:
+                logging.warning(f"truncated block at offset {offset}")
+                break
+            if struct.unpack_from(self.endian + "I", buf, offset + block_length - 4)[0] != block_length:
+                raise ValueError(f"{self.filename}: block length mismatch at offset {offset}")
+
+            if block_type == EPB and packet_filter is not None:
+                interface_id, timestamp_high, timestamp_low = struct.unpack_from(self.endian + "III", buf, offset + 8)
+                cap_len = struct.unpack_from(self.endian + "I", buf, offset + 20)[0]
+                link_type, resolution, _ = self.interfaces[interface_id]
+                timestamp = ((timestamp_high << 32) + timestamp_low) / resolution
+                if not packet_filter.match(buf, offset + 28, min(cap_len, block_length - 32), timestamp, link_type):
+                    offset += block_length
+                    continue
+
+            block = buf[offset + 8 : offset + block_length - 4]
+
+            if block_type == SHB:
+                parse_shb(block)
+                for section in self.sections:
+                    if section[0] == offset:
+                        break
+                else:
+                    section = [offset, self.endian, []]
+                    self.sections.append(section)
+                    self.sections.sort(key=itemgetter(0))
+                self.interfaces = section[2]
+
+            elif block_type == IDB:
+                # an already known interface when the capture is read again
+                if not any(i[2] == offset for i in self.interfaces):
+                    link_type, resolution = parse_idb(block, self.endian)
+                    self.interfaces.append([link_type, resolution, offset])
+
+            elif block_type == EPB:
+                yield offset, block_type, block
+
+            elif block_type == DPEB:
+                # parse_dpeb(block, self.endian)
+                pass
+
+            elif block_type == ISB:
+                interface_id, counters = parse_isb(block, self.endian)
+                section = max((s[0] for s in self.sections if s[0] <= offset), default=0)
+                self.statistics[(section, interface_id)] = counters
+
+            elif block_type == SPB:
+                pass
+
+            else:
+                logging.error(f"0x{block_type:08x} UNKNOWN BLOCK TYPE length: {block_length}")
+                hexdump(block, logging.error)
+
+            offset += block_length
+
+
+def block_at(buf, offset, size, endian):
+    """Return the length of the pcapng block at `offset` if it looks valid (known type,
+    length checked against its trailing copy), else 0."""
+    if offset + 12 > size:
+        return 0
+    block_type, length = struct.unpack_from(endian + "II", buf, offset)
+    if block_type not in BLOCK_TYPES or length < 12 or length % 4 != 0 or offset + length > size:
+        return 0
+    if struct.unpack_from(endian + "I", buf, offset + length - 4)[0] != length:
+        return 0
+    return length
+
+
+def find_block(buf, offset, size, endian):
+    """Return the offset of the first block boundary at or after `offset`: the blocks are 4-byte
+    aligned, a boundary is followed by `CONFIRM_BLOCKS` valid blocks (or the end of the file)."""
+    offset += -offset % 4
+    while offset < size:
+        next_offset = offset
+        for _ in range(CONFIRM_BLOCKS):
+            if next_offset == size:
+                break
+            length = block_at(buf, next_offset, size, endian)
+            if length == 0:
+                break
+            next_offset += length
+        else:
+            return offset
+        if next_offset == size:
+            return offset
+        offset += 4
+    return size
+
+
+def pcapng_chunks(reader, size):
+    """Split a pcapng capture into `(start, end)` byte ranges of about `size` bytes, at block boundaries."""
+    buf = reader.buffer
+    length = len(buf)
+    bounds = [0]
+    while bounds[-1] < length:
+        bounds.append(find_block(buf, bounds[-1] + size, length, reader.endian))
+    return list(zip(bounds, bounds[1:]))
+
+
+def udp_chunk(filename, start, end, sections, packet_filter):
+    """Return the UDP datagrams `(timestamp, source, payload)` of the pcapng chunk [start, end[ sorted by
+    timestamp, the sections known at its end, the fragments of the datagrams it does not complete
+    (see `Reassembler.unfinished`) and the statistics of its ISBs (see `PcapReader.statistics`).
+    `sections` are those known at its start (see `PcapReader.sections`).
+    Return None if the chunk cannot be read with them."""
+    try:
+        with PcapReader(filename) as reader:
+            if sections:
+                reader.sections = [
+                    [offset, endian, [list(i) for i in interfaces]] for offset, endian, interfaces in sections
+                ]
+                _, reader.endian, reader.interfaces = reader.sections[-1]
+            decoder = UdpDecoder(packet_filter)
+            datagrams = [
+                (timestamp, source, payload)
+                for _, timestamp, source, payload in udp_datagrams(reader, packet_filter, start, end, decoder)
+            ]
+            datagrams.sort(key=itemgetter(0))
+            return datagrams, reader.sections, decoder.fragments.unfinished(), reader.statistics
+    except (ValueError, IndexError, struct.error):
+        return None
+
+
+def read_udp_parallel(
+    filename, port=11101, start=None, end=None, jobs=0, chunk_size=64 * 1024 * 1024, packet_filter=None, sources=False
+):
+    """Yield `(timestamp, payload)` of the UDP datagrams sent from `port` (selected by `packet_filter`
+    if given) in timestamp order, the pcapng capture being read by chunks in a process pool (`jobs`, 0: one per core).
+    With `sources`, yield `(timestamp, (source address, source port), payload)`.
+
+    Each chunk is read with the sections and interfaces (IDB) known at its start. They are guessed
+    from the blocks at the start of the capture, and checked against those at the end of the previous
+    chunk: a chunk read with the wrong ones (new section or interface in the middle of the capture)
+    is read again, and the following chunks with the sections known at its end.
+
+    The datagrams are yielded as the chunks are read, in order: those of the chunks read so far up to
+    the first timestamp of the last one, the following chunks being assumed not to go below it.
+    """
+    with PcapReader(filename) as reader:
+        if reader.format != "pcapng":
+            raise ValueError(f"{filename}: not a pcapng capture")
+        next(reader._pcapng_blocks(0), None)  # SHB et IDB qui précèdent le premier paquet
+        sections = reader.sections
+        ranges = pcapng_chunks(reader, chunk_size)
+
+    if packet_filter is None:
+        packet_filter = PacketFilter(sport=port, start=start, end=end)
+    tasks = [[str(filename), a, b, sections if a else [], packet_filter] for a, b in ranges]
+    window = 2 * (jobs or os.cpu_count() or 1)  # morceaux soumis d'avance
+    output = (lambda datagram: datagram) if sources else itemgetter(0, 2)
+    decoder = UdpDecoder(packet_filter)  # datagrammes à cheval sur deux morceaux
+    statistics = {}
+
+    with ProcessPoolExecutor(jobs or None) if jobs != 1 and len(tasks) > 1 else nullcontext() as executor:
+        futures = {}
+
+        def submit(j):
+            if executor is not None and j < len(tasks) and j not in futures:
+                futures[j] = executor.submit(udp_chunk, *tasks[j])
+
+        try:
+            context = []
+            held = []  # datagrammes des morceaux lus, postérieurs au premier du dernier d'entre eux
+            for i, task in enumerate(tasks):
+                for j in range(i, i + window):
+                    submit(j)
+                result = futures.pop(i).result() if executor is not None else udp_chunk(*task)
+                if result is None or (task[1] and task[3] != context):
+                    # lu avec un mauvais contexte: relu avec le bon, et les morceaux suivants
+                    # qui doivent l'être sont relancés avec le contexte à la fin de celui-ci
+                    logging.debug(f"chunk {task[1]}-{task[2]} read again with the sections known at its start")
+                    task[3] = context
+                    result = udp_chunk(*task)
+                    if result is None:
+                        raise ValueError(f"{filename}: cannot read the blocks at offset {task[1]}")
+                    for j in range(i + 1, len(tasks)):
+                        if tasks[j][3] != result[1]:
+                            tasks[j][3] = result[1]
+                            if j in futures:
+                                futures.pop(j).cancel()
+                                submit(j)
+                datagrams, context, fragments, chunk_statistics = result
+                statistics.update(chunk_statistics)  # compteurs cumulés: les derniers lus
+
+                # fragments des datagrammes commencés dans les morceaux précédents
+                reassembled = []
+                for key, timestamp, offset, more, data in fragments:
+                    datagram = decoder.fragment(key, timestamp, offset, more, data)
+                    if datagram is not None and datagram[4]:
+                        reassembled.append((timestamp, (datagram[0], datagram[1]), bytes(datagram[4])))
+                if reassembled:
+                    datagrams = list(heapq.merge(datagrams, reassembled, key=itemgetter(0)))
+                if not datagrams:
+                    continue
+
+                watermark = datagrams[0][0]
+                merged = heapq.merge(held, datagrams, key=itemgetter(0))
+                held = []
+                for datagram in merged:
+                    if datagram[0] >= watermark:
+                        held.append(datagram)
+                        held.extend(merged)
+                        break
+                    yield output(datagram)
+            for datagram in held:
+                yield output(datagram)
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    if dropped_packets(statistics):
+        logging.warning(f"{filename}: {dropped_packets(statistics)} packets dropped during the capture")
+
+
+def scapy_udp(filename, port=11101):
+    """Yield `(timestamp, payload)` of the UDP datagrams sent from `port`, using scapy.
+    Slower than `read_udp`, but understands every format and protocol stack that scapy knows.
+    """
+    logging.getLogger("scapy.runtime").setLevel(logging.ERROR + 1)
+    from scapy.all import UDP
+    from scapy.all import PcapReader as ScapyReader
+
+    with ScapyReader(str(filename)) as packets:
+        for p in packets:
+            if UDP in p and p[UDP].sport == port and len(p[UDP].payload) > 0:
+                yield float(p.time), bytes(p[UDP].payload)
+
+
+def udp_datagrams(reader, packet_filter=None, offset=None, end=None, decoder=None):
+    """Yield `(offset, timestamp, (source address, source port), payload)` of the UDP datagrams read by
+    a `PcapReader` and selected by `packet_filter`, whatever the link type, fragmented datagrams being
+    reassembled (`offset` being then that of the last fragment). Source addresses are bytes."""
+    decoder = decoder or UdpDecoder(packet_filter)
+    for pos, timestamp, link_type, data in reader.packets(offset, packet_filter, end):
+        datagram = decoder.decode(data, link_type, timestamp)
+        if datagram is not None and datagram[4]:
+            yield pos, timestamp, (datagram[0], datagram[1]), bytes(datagram[4])
+
+
+def udp_packets(reader, port=11101, offset=None, start=None, end=None):
+    """Yield `(offset, timestamp, payload)` of the UDP datagrams sent from `port` read by a `PcapReader`,
+    in the time range [start, end[ if given."""
+    packet_filter = PacketFilter(sport=port, start=start, end=end)
+    for pos, timestamp, _, payload in udp_datagrams(reader, packet_filter, offset):
+        yield pos, timestamp, payload
+
+
+def read_udp(filename, port=11101, scapy=False, start=None, end=None, jobs=1):
+    """Yield `(timestamp, payload)` of the UDP datagrams sent from `port`, lazily, in the time range
+    [start, end[ if given. Falls back to scapy (if installed) for the capture formats `PcapReader` does not know.
+    With `jobs` other than 1, a pcapng capture is read by `read_udp_parallel`.
+    """
+    if not scapy:
+        try:
+            reader = PcapReader(filename)
+        except ValueError as e:
+            logging.warning(f"{e}, fallback to scapy")
+        else:
+            if jobs != 1 and reader.format == "pcapng":
+                reader.close()
+                yield from read_udp_parallel(filename, port, start, end, jobs)
+                return
+            with reader:
+                for _, timestamp, payload in udp_packets(reader, port, start=start, end=end):
+                    yield timestamp, payload
+                if reader.dropped():
+                    logging.warning(f"{filename}: {reader.dropped()} packets dropped during the capture")
+            return
+
+    for timestamp, payload in scapy_udp(filename, port):
+        if (start is None or timestamp >= start) and (end is None or timestamp < end):
+            yield timestamp, payload
+
+
+@click.command(help="Extrait les trames UDP port 11101 d'une capture (Python version)")
+@click.option("--sport", type=int, help="Port UDP source (0: tous) [défaut: 11101, tous avec --demux]")
+@click.option("--dport", type=int, help="Port UDP destination")
+@click.option("--src", help="Adresse IP source")
+@click.option("--dst", help="Adresse IP destination")
+@click.option("--from", "start", type=click.DateTime(), help="Début de la plage de temps")
+@click.option("--to", "end", type=click.DateTime(), help="Fin de la plage de temps")
+@click.option("-j", "--jobs", type=click.IntRange(0), default=1, help="Nombre de processus (0: un par cœur), pcapng")
+@click.option("--chunk", type=click.IntRange(1), default=64, help="Taille des morceaux en Mo")
+@click.option("--demux", is_flag=True, help="Un fichier par source (adresse, port) dans le répertoire OUTPUT")
+@click.argument("filename")
+@click.argument("output", default="")
+def main(sport, dport, src, dst, start, end, jobs, chunk, demux, filename, output):
+    if sport is None:
+        sport = 0 if demux else 11101
+
+    try:
+        reader = PcapReader(filename)
+    except ValueError as e:
+        logging.error(e)
+        exit(2)
+
+    packet_filter = PacketFilter(
+        sport=sport or None,
+        dport=dport,
+        src=src,
+        dst=dst,
+        proto="udp",
+        start=start and start.timestamp(),
+        end=end and end.timestamp(),
+    )
+
+    if jobs != 1 and reader.format == "pcapng":
+        reader.close()
+        datagrams = read_udp_parallel(
+            filename,
+            sport or None,
+            jobs=jobs,
+            chunk_size=chunk * 1024 * 1024,
+            packet_filter=packet_filter,
+            sources=True,
+        )
+    else:
+        datagrams = (
+            (timestamp, source, payload) for _, timestamp, source, payload in udp_datagrams(reader, packet_filter)
+        )
+
+    def write(f, timestamp, payload):
+        timestamp = datetime.fromtimestamp(timestamp).isoformat()
+        for line in str(payload, "utf-8", "replace").splitlines():
+            print(timestamp, line, file=f)
+
+    with reader:
+        if not demux:
+            with nullcontext(sys.stdout) if output in ("", "-") else Path(output).open("w") as out:
+                for timestamp, _, payload in datagrams:
+                    write(out, timestamp, payload)
+            return
+
+        # démultiplexage en une passe: un flux NMEA par (adresse, port) source
+        directory = Path(output or ".")
+        directory.mkdir(parents=True, exist_ok=True)
+        streams = {}
+        try:
+            for timestamp, source, payload in datagrams:
+                if not payload.startswith(NMEA_START):
+                    continue
+                f = streams.get(source)
+                if f is None:
+                    address, port = source
+                    name = f"{Path(filename).stem}_{ip_ntoa(address).replace(':', '-')}_{port}.txt"
+                    f = streams[source] = (directory / name).open("w")
+                    click.echo(f"{ip_ntoa(address)}:{port} → {f.name}", err=True)
+                write(f, timestamp, payload)
+        finally:
+            for f in streams.values():
+                f.close()
 
 
 if __name__ == "__main__":
@@ -1,88 +1,216 @@
 #!/usr/bin/env python3
 
+import asyncio
+import json
 import re
-import socket
 import time
+from array import array
+from collections import defaultdict
 from datetime import datetime
+from itertools import islice
+from pathlib import Path
 
 import click
-from scapy.all import IP, UDP, rdpcap
 
+from fanout import Fanout, parse_target
+from nmea0183 import parse_line
+from nmealog import NmeaLog, is_nmealog
+from pcap import PcapReader, read_udp, udp_packets
+from restamp import Restamper
 
-def read_file(filename):
-    if filename.endswith(".txt"):
+GAP = 120  # durée sans trame (en secondes) qui sépare deux plages
+MAX_WAIT = 30  # attente maximale (en secondes) entre deux trames, au-delà elle est ramenée à WAIT_AFTER_GAP
+WAIT_AFTER_GAP = 10
+
+
+def read_file(filename, offset=None, sections=None):
+    """Yield `(offset, timestamp, data)` of a capture, starting at `offset` if given.
+
+    The offset is a byte offset for `.txt` and pcap/pcapng captures, a record number for
+    indexed captures. `sections` are the pcapng sections (see `PcapReader.sections`),
+    restored before reading and updated while the capture is read.
+    """
+    if is_nmealog(filename):
+        with NmeaLog(filename) as log:
+            for i in range(offset or 0, len(log)):
+                timestamp, sentence = log.record(i)
+                yield i, timestamp, sentence + b"\r\n"
+
+    elif filename.endswith(".txt"):
         with open(filename, "rb") as f:
+            offset = offset or 0
+            f.seek(offset)
             for line in f:
-                timestamp, data = line.split(b" ")
-                timestamp = datetime.strptime(timestamp.decode(), "%Y-%m-%dT%H:%M:%S.%f").timestamp()
-                yield timestamp, data
+                sentence = parse_line(line)
+                if sentence is not None:
+                    yield offset, sentence.timestamp, sentence.raw + b"\r\n"
+                offset += len(line)
+
     else:
-        for p in rdpcap(filename):
-            u = p / IP() / UDP()
-            if u.sport == 11101 and u.len > 0:
-                yield p.time, u.load
+        try:
+            reader = PcapReader(filename)
+        except ValueError:
+            # format inconnu: lecture par scapy, l'offset est le numéro de trame
+            packets = enumerate(read_udp(filename, scapy=True))
+            for i, (timestamp, payload) in islice(packets, offset, None):
+                yield i, timestamp, payload
+            return
+
+        with reader:
+            if sections is not None:
+                if not sections:
+                    sections.extend(reader.sections)
+                reader.sections = sections
+            yield from udp_packets(reader, offset=offset)
+
+
+def load_plages(filename):
+    """Return the sessions (plages) of a capture as `(start, end, count, offset)` and the pcapng sections.
+
+    A session ends when no sentence has been received for `GAP` seconds. The sessions are
+    saved next to the capture (`<filename>.plages`) and found again as long as the capture is unchanged.
+    """
+    index_file = Path(filename + ".plages")
+    stat = Path(filename).stat()
+
+    try:
+        index = json.loads(index_file.read_text())
+        if (index["size"], index["mtime"], index["gap"]) == (stat.st_size, stat.st_mtime_ns, GAP):
+            return index["plages"], index["sections"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    plages = []
+    sections = []
+    for offset, ptime, _ in read_file(filename, sections=sections):
+        if plages and ptime - plages[-1][1] <= GAP:
+            plages[-1][1] = ptime
+            plages[-1][2] += 1
+        else:
+            plages.append([ptime, ptime, 1, offset])
 
-    yield 2**63 - 1, b""
+    index = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "gap": GAP, "plages": plages, "sections": sections}
+    try:
+        index_file.write_text(json.dumps(index))
+    except OSError as e:
+        print(f"index des plages non sauvegardé: {e}")
 
+    return plages, sections
 
-def nmea_checksum(sentence):
-    checksum = 0
-    for b in sentence[1:-3]:
-        if b != b"I":
-            checksum ^= b
-    return sentence[:-2] + f"{checksum:02X}".encode()
 
+class Scheduler:
+    """Cadence l'envoi des trames sur l'horloge monotone de la boucle asyncio.
 
-def update_date(now, sentence):
-    sentence = sentence.rstrip()
+    La trame horodatée `ptime` est envoyée à `t0 + (ptime - p0) / speed`, où `t0` et `p0`
+    sont l'instant d'envoi et l'horodatage de la première trame: le retard d'une trame ne
+    se reporte pas sur les suivantes. Avec `speed=None`, les trames partent au plus vite.
+    """
 
-    if sentence[3:6] == b"RMC":
-        f = sentence.split(b",")
-        f[1] = f"{now.hour:02}{now.minute:02}{now.second:02}.{now.microsecond//10000:02}".encode()
-        f[9] = f"{now.day:02}{now.month:02}{now.year%100:02}".encode()
-        sentence = nmea_checksum(b",".join(f))
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.t0 = None
+        self.p0 = None
+        self.lateness = array("d")
 
-    if sentence[3:6] == b"ZDA":
-        f = sentence.split(b",")
-        f[1] = f"{now.hour:02}{now.minute:02}{now.second:02}.{now.microsecond//10000:02}".encode()
-        f[2] = f"{now.day:02}".encode()
-        f[3] = f"{now.month:02}".encode()
-        f[4] = f"{now.year:04}".encode()
-        sentence = nmea_checksum(b",".join(f))
+    async def wait(self, ptime):
+        """Attend l'instant d'envoi de la trame horodatée `ptime`."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
 
-    if sentence[3:6] == b"GGA":
-        f = sentence.split(b",")
-        f[1] = f"{now.hour:02}{now.minute:02}{now.second:02}.{now.microsecond//10000:02}".encode()
-        sentence = nmea_checksum(b",".join(f))
+        if self.speed is None:
+            if len(self.lateness) % 1000 == 0:
+                await asyncio.sleep(0)  # laisse la main aux autres tâches
+            self.lateness.append(0)
+            return
 
-    if sentence[3:6] == b"GRS":
-        f = sentence.split(b",")
-        f[1] = f"{now.hour:02}{now.minute:02}{now.second:02}.{now.microsecond//10000:02}".encode()
-        print(sentence)
-        sentence = nmea_checksum(b",".join(f))
+        if self.t0 is None:
+            self.t0, self.p0 = now, ptime
 
-    if sentence[3:6] == b"GLL":
-        f = sentence.split(b",")
-        f[5] = f"{now.hour:02}{now.minute:02}{now.second:02}.{now.microsecond//10000:02}".encode()
-        sentence = nmea_checksum(b",".join(f))
+        target = self.t0 + (ptime - self.p0) / self.speed
+        if target - now > MAX_WAIT:
+            print()
+            print(f"Delay {target - now:.3f}s")
+            print()
+            self.t0 -= target - now - WAIT_AFTER_GAP
+            target = now + WAIT_AFTER_GAP
+
+        if target > now:
+            await asyncio.sleep(target - now)
+        self.lateness.append(loop.time() - target)
+
+    def report(self):
+        """Retourne les statistiques du retard d'envoi des trames."""
+        if self.speed is None or len(self.lateness) == 0:
+            return f"{len(self.lateness)} trames"
+        lateness = sorted(self.lateness)
+        n = len(lateness)
+        return (
+            f"{n} trames, retard (ms): moyen {sum(lateness) / n * 1000:.3f}"
+            f" médian {lateness[n // 2] * 1000:.3f}"
+            f" p99 {lateness[min(n - 1, n * 99 // 100)] * 1000:.3f}"
+            f" max {lateness[-1] * 1000:.3f}"
+        )
+
+
+async def replay(packets, scheduler, output, quiet=False, restamper=None):
+    """Envoie les trames `(ptime, data)` aux destinations de `output`, cadencées par le scheduler.
+    Avec un `restamper`, l'heure des trames est remplacée par l'heure d'envoi."""
+    for ptime, data in packets:
+        await scheduler.wait(ptime)
 
-    return sentence
+        if restamper:
+            data = restamper.datagram(data, time.time())
+
+        if not quiet:
+            msg = repr(data.decode())
+            if len(msg) > 40:
+                msg = msg[:38] + "…'"
+            timestamp_orig = datetime.fromtimestamp(ptime).isoformat()
+            click.echo(f"{datetime.now().isoformat()} {click.style(timestamp_orig, fg='blue')} send {msg}")
+
+        output.send(data)
 
 
 @click.command(help="Rejoue les trames NMEA")
 @click.option("-b", "--broadcast", is_flag=True, help="Envoyer les trames en broadcast")
 @click.option("-p", "--port", type=int, default=11101, help="Port UDP")
-@click.option("-a", "--address", type=str, default="localhost", help="Adresse de destination")
+@click.option(
+    "-a", "--address", type=str, multiple=True, default=["localhost"], help="Adresse[:port] de destination (répétable)"
+)
+@click.option("-g", "--multicast", type=str, help="Groupe multicast de destination")
+@click.option("--ttl", type=int, default=1, help="TTL multicast")
+@click.option("-t", "--tcp", "tcp_port", type=int, help="Port TCP d'écoute pour les clients")
 @click.option("-i", "--info", "opt_info", is_flag=True, help="Afficher les informations")
 @click.option("-r", "--range", "opt_range", type=str, default=0, help="Numéro de plage")
-@click.option("-s", "--speed", "opt_speed", type=click.IntRange(1, 10), default=1, help="Vitesse de rejeu")
+@click.option(
+    "-s", "--speed", "opt_speed", type=click.FloatRange(0, min_open=True), default=1.0, help="Vitesse de rejeu"
+)
+@click.option("-m", "--max", "opt_max", is_flag=True, help="Rejouer aussi vite que possible")
+@click.option("-q", "--quiet", is_flag=True, help="Ne pas afficher les trames envoyées")
+@click.option("-d", "--restamp", is_flag=True, help="Remplacer l'heure des trames par l'heure d'envoi")
 @click.argument("filename")
-def main(broadcast, port, address, opt_info, opt_range, opt_speed, filename):
-    # ouvre la socket pour envoyer les trames
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+def main(
+    broadcast,
+    port,
+    address,
+    multicast,
+    ttl,
+    tcp_port,
+    opt_info,
+    opt_range,
+    opt_speed,
+    opt_max,
+    quiet,
+    restamp,
+    filename,
+):
+    # destinations des trames
     if broadcast:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        targets = [("<broadcast>", port)]
+    else:
+        targets = [parse_target(a, port) for a in address]
+    if multicast:
+        multicast = parse_target(multicast, port)
 
     # analyse l'option de plage
     plages = []
@@ -129,82 +257,52 @@ def main(broadcast, port, address, opt_info, opt_range, opt_speed, filename):
             click.echo("Erreur: plage invalide: « " + click.style(r, fg="red") + " »", color=True)
             return 1
 
-    time_offset = None
-    rattrapage = 0
-
-    debut = 0
-    fin = 0
-    plage = 1
-    nb = 0
-
-    for ptime, data in read_file(filename):
-        if debut == 0:
-            debut = ptime
-        else:
-            if ptime - fin > 120:
-                if opt_info:
-                    print(
-                        f"plage {plage:2} :",
-                        datetime.fromtimestamp(debut).isoformat(),
-                        datetime.fromtimestamp(fin).isoformat(),
-                        f"{nb:6} {int(ptime - debut) if data else '':6}",
-                    )
-                plage += 1
-                debut = ptime
-                nb = 0
-        fin = ptime
-        nb += 1
-
-        if opt_info:
-            continue
-
-        timestamp_orig = None
-
-        if len(plages) != 0:
-            for r in plages:
-                if plage == r[0] or r[0] == 0:  # matche le numéro de plage
-                    timestamp_orig = datetime.fromtimestamp(float(ptime))
-                    minutes = timestamp_orig.hour * 60 + timestamp_orig.minute
-
-                    if minutes >= r[1] and minutes < r[2]:  # matche la plage horaire
-                        break
-            else:
+    index, sections = load_plages(filename)
+
+    if opt_info:
+        for n, (debut, fin, nb, _) in enumerate(index, 1):
+            print(
+                f"plage {n:2} :",
+                datetime.fromtimestamp(debut).isoformat(),
+                datetime.fromtimestamp(fin).isoformat(),
+                f"{nb:6} {int(fin - debut):6}",
+            )
+        return
+
+    # plages horaires à rejouer, par numéro de plage
+    selection = defaultdict(list)
+    for r in plages:
+        for plage in range(1, len(index) + 1) if r[0] == 0 else [r[0]]:
+            selection[plage].append((r[1], r[2]))
+
+    def packets():
+        for plage in sorted(selection):
+            if plage > len(index):
+                click.echo(f"Erreur: pas de plage {plage}")
                 continue
+            _, _, nb, offset = index[plage - 1]
 
-        if not timestamp_orig:
-            timestamp_orig = datetime.fromtimestamp(float(ptime))
-
-        now = datetime.now()
-        now_rattrapage = now.timestamp() + rattrapage
-        if time_offset is None:
-            time_offset = now_rattrapage - float(ptime)
+            for _, ptime, data in islice(read_file(filename, offset, sections), nb):
+                timestamp_orig = datetime.fromtimestamp(ptime)
+                minutes = timestamp_orig.hour * 60 + timestamp_orig.minute
+                if any(debut <= minutes < fin for debut, fin in selection[plage]):  # matche la plage horaire
+                    yield ptime, data
 
-        delay = float(ptime) + time_offset - now_rattrapage
-        if delay > 30:
-            rattrapage += delay - 30
-            print()
-            print(f"Delay {delay}s")
-            print()
-            delay = 10
-
-        if delay > 0:
-            rattrapage += delay * (opt_speed - 1) / 10
-            delay *= (11 - opt_speed) / 10
-            time.sleep(delay)
-
-        timestamp = datetime.fromtimestamp(float(ptime) + time_offset).isoformat()
-
-        msg = repr(data.decode())
-        if len(msg) > 40:
-            msg = msg[:38] + "…'"
-        click.echo(timestamp + " " + click.style(timestamp_orig.isoformat(), fg="blue") + f" send {msg}")
-
-        # data = b"\r\n".join(update_date(now, d) for d in data.split(b"\n"))+b"\r\n"
-
-        if broadcast:
-            sock.sendto(data, ("<broadcast>", port))
-        else:
-            sock.sendto(data, (address, port))
+    async def run():
+        await output.start()
+        try:
+            await replay(packets(), scheduler, output, quiet, Restamper() if restamp else None)
+        finally:
+            await output.close()
+
+    output = Fanout(targets, multicast, ttl, tcp_port)
+    scheduler = Scheduler(None if opt_max else opt_speed)
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    click.echo(scheduler.report())
+    click.echo(output.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Réécrit l'heure et la date des trames NMEA (RMC, ZDA, GGA, GRS, GLL) avec l'heure d'envoi.
+# NMEA reference: https://gpsd.gitlab.io/gpsd/NMEA.html
+
+import time
+from datetime import datetime, timezone
+
+import click
+
+from nmea0183 import xor_bytes
+
+# champs réécrits par type de trame: (numéro de champ, format), par numéro croissant
+# l'heure garde le même nombre de décimales que le champ d'origine
+TEMPLATES = {
+    b"RMC": ((1, "time"), (9, "date")),
+    b"ZDA": ((1, "time"), (2, "day"), (3, "month"), (4, "year")),
+    b"GGA": ((1, "time"),),
+    b"GRS": ((1, "time"),),
+    b"GLL": ((5, "time"),),
+}
+
+FORMATS = {"time": "%H%M%S", "date": "%d%m%y", "day": "%d", "month": "%m", "year": "%Y"}
+
+# checksum hexadécimal -> valeur (majuscules ou minuscules)
+HEX = {b"%02X" % i: i for i in range(256)} | {b"%02x" % i: i for i in range(256)}
+
+
+class Restamper:
+    """Réécrit l'heure des trames à partir de gabarits par type de trame.
+
+    Seuls les champs concernés sont remplacés, et le checksum est mis à jour par XOR
+    des octets retirés et des octets ajoutés, sans être recalculé sur toute la trame.
+    Les valeurs des champs (et leur XOR) sont mises en cache pour chaque milliseconde,
+    ainsi que le XOR des anciennes valeurs.
+    """
+
+    def __init__(self):
+        self.tick = None
+        self.values = {}
+        self.xors = {}
+
+    def value(self, kind, decimals, now):
+        """Return the new value of a field and its XOR (the cache must be valid for `now`)."""
+        value = self.values.get((kind, decimals))
+        if value is None:
+            t = datetime.fromtimestamp(now, timezone.utc)
+            if kind == "time":
+                s = t.strftime("%H%M%S").encode()
+                if decimals:
+                    s += b".%0*d" % (decimals, t.microsecond // 10 ** (6 - decimals))
+            else:
+                s = t.strftime(FORMATS[kind]).encode()
+            value = self.values[(kind, decimals)] = s, xor_bytes(s)
+        return value
+
+    def sentence(self, sentence, now):
+        """Return the sentence (bytes, without line ending) stamped with the time `now` (epoch)."""
+        template = TEMPLATES.get(sentence[3:6])
+        if template is None or sentence[:1] != b"$":
+            return sentence
+        body, star, tail = sentence.rpartition(b"*")
+        checksum = HEX.get(tail[:2])
+        if not star or checksum is None:
+            return sentence  # checksum absent ou invalide: trame laissée telle quelle
+
+        tick = int(now * 1000)
+        if tick != self.tick:
+            self.tick = tick
+            self.values = {}
+            if len(self.xors) > 4096:
+                self.xors = {}
+
+        values, xors = self.values, self.xors
+        fields = body.split(b",", template[-1][0] + 1)
+        for n, kind in template:
+            if n >= len(fields):
+                break
+            old = fields[n]
+            if not old:
+                continue  # champ vide (pas de fix): laissé tel quel
+            decimals = len(old) - 7 if kind == "time" and len(old) > 7 else 0
+            value = values.get((kind, decimals))
+            new, new_xor = value if value else self.value(kind, decimals, now)
+            old_xor = xors.get(old)
+            if old_xor is None:
+                old_xor = xors[old] = xor_bytes(old)
+            checksum ^= old_xor ^ new_xor
+            fields[n] = new
+
+        return b",".join(fields) + b"*%02X" % checksum + tail[2:]
+
+    def datagram(self, data, now):
+        """Return the datagram with each of its sentences stamped with the time `now`."""
+        end = data.find(b"\n")
+        if end < 0 or end == len(data) - 1:
+            # une seule trame par datagramme: cas le plus courant
+            if data[3:6] not in TEMPLATES:
+                return data
+            sentence = data.rstrip(b"\r\n")
+            return self.sentence(sentence, now) + data[len(sentence) :]
+        lines = data.splitlines(keepends=True)
+        stamped = []
+        for line in lines:
+            sentence = line.rstrip(b"\r\n")
+            stamped.append(self.sentence(sentence, now) + line[len(sentence) :])
+        return b"".join(stamped)
+
+
+@click.command(help="Mesure le débit de réécriture de l'heure des trames")
+@click.argument("filename")
+@click.option("-n", "--repeat", type=int, default=10, help="Nombre de lectures de la capture")
+def main(filename, repeat):
+    from replay import read_file
+
+    restamper = Restamper()
+    datagrams = [data for _, _, data in read_file(filename)]
+    sentences = sum(len(data.splitlines()) for data in datagrams) * repeat
+
+    def read():
+        for _ in range(repeat):
+            for _ in read_file(filename):
+                pass
+
+    def read_restamp():
+        for _ in range(repeat):
+            for _, ptime, data in read_file(filename):
+                restamper.datagram(data, time.time())
+
+    def restamp():
+        for _ in range(repeat):
+            for data in datagrams:
+                restamper.datagram(data, time.time())
+
+    for name, function in (
+        ("lecture", read),
+        ("lecture + réécriture", read_restamp),
+        ("réécriture seule", restamp),
+    ):
+        t = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t
+        print(f"{name:<24} {sentences / elapsed:12,.0f} trames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,90 @@
 
 # NMEA reference: https://gpsd.gitlab.io/gpsd/NMEA.html
 
+import mmap
+import re
+import sys
+from datetime import datetime
 from pathlib import Path
 
 import click
 
+from nmea0183 import parse_line, read_sentences
+
+DATETIME_FORMATS = ["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+
 
 def validate_sentence(ctx, param, value):
-    if len(value) == 3:
-        return value.upper()
-    raise click.BadParameter("must be 3 uppercase letters")
+    sentences = value.upper().split(",")
+    if all(len(s) == 3 and s.isalnum() for s in sentences):
+        return sentences
+    raise click.BadParameter("must be 3 uppercase letters, comma separated")
+
+
+def line_start(buf, offset):
+    """Return the offset of the first line starting at or after `offset`."""
+    if offset == 0:
+        return 0
+    i = buf.find(b"\n", offset - 1)
+    return len(buf) if i < 0 else i + 1
+
+
+def line_timestamp(buf, start):
+    end = buf.find(b" ", start, start + 64)
+    return datetime.fromisoformat(buf[start:end].decode()).timestamp()
+
 
+def bisect_time(buf, timestamp):
+    """Return the offset of the first line at or after `timestamp` in a `.txt` capture (sorted by time)."""
+    lo, hi = 0, len(buf)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = line_start(buf, mid)
+        if start < len(buf) and line_timestamp(buf, start) < timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return line_start(buf, lo)
 
-@click.command(help="Cherche une sentence NMEA")
+
+def grep_txt(filename, sentences, start=None, end=None):
+    """Yield the `Sentence` of the given types of a `.txt` capture.
+
+    The file is mapped in memory and searched with a regular expression on bytes: only the
+    matching lines are decoded. The time window is found by binary search.
+    """
+    pattern = re.compile(rb" [$!]..(?:" + b"|".join(re.escape(s.encode()) for s in sentences) + rb"),")
+    with open(filename, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            lo = 0 if start is None else bisect_time(buf, start)
+            hi = len(buf) if end is None else bisect_time(buf, end)
+            for match in pattern.finditer(buf, lo, hi):
+                i = buf.rfind(b"\n", lo, match.start()) + 1 or lo
+                j = buf.find(b"\n", match.end())
+                sentence = parse_line(buf[i : j if j >= 0 else len(buf)])
+                if sentence is not None:
+                    yield sentence
+
+
+@click.command(help="Cherche des sentences NMEA")
 @click.argument("sentence", type=click.UNPROCESSED, callback=validate_sentence)
 @click.argument("filename", type=Path)
-def main(filename, sentence):
-    for line in filename.open():
-        _, nmea = line.rstrip().split(maxsplit=1)
-        if nmea.startswith("$") and nmea[3:6] == sentence:
-            print(nmea)
+@click.option("--from", "start", type=click.DateTime(DATETIME_FORMATS), help="Début (heure locale)")
+@click.option("--to", "end", type=click.DateTime(DATETIME_FORMATS), help="Fin (heure locale, exclue)")
+def main(filename, sentence, start, end):
+    start = start and start.timestamp()
+    end = end and end.timestamp()
+
+    if filename.suffix == ".txt":
+        found = grep_txt(filename, sentence, start, end)
+    else:
+        found = read_sentences(filename, start, end, types=sentence)
+
+    write = sys.stdout.buffer.write
+    for nmea in found:
+        write(nmea.raw + b"\n")
 
 
 if __name__ == "__main__":
@@ -3,11 +3,21 @@
 # NMEA reference: https://gpsd.gitlab.io/gpsd/NMEA.html
 # AIS info: https://gpsd.gitlab.io/gpsd/AIVDM.html
 
-from collections import defaultdict
-from pathlib import Path
+import math
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 
 import click
 
+from nmea0183 import chunks, read_chunk
+
+GAP = 10  # durée sans trame (en secondes) comptée comme une coupure
+BINS_PER_DECADE = 20  # résolution de l'histogramme des intervalles: ~12 %
+MIN_INTERVAL = 1e-4  # borne basse de l'histogramme (en secondes)
+BINS = 10 * BINS_PER_DECADE  # de 0.1 ms à 10^6 s
+MAX_GAPS = 1000  # coupures conservées pour l'affichage
+
 TALKER_IDS = {
     "GP": "Global Positioning System",
     "YD": "Transducer - Displacement, Angular or Linear (obsolete)",
@@ -48,39 +58,198 @@ SENTENCES = {
 }
 
 
-@click.command(help="Stats trames NMEA")
-@click.argument("filename")
-def main(filename):
-    filename = Path(filename)
-
-    talker_ids = defaultdict(int)
-    sentences = defaultdict(int)
-    ais = defaultdict(int)
-
-    for line in filename.open():
-        _, nmea = line.split(" ", 1)
-        tag = nmea.split(",", 1)[0]
-
-        if tag.startswith("$"):
-            talker_ids[tag[1:3]] += 1
-            sentences[tag[3:6]] += 1
-        elif tag.startswith("!AI"):  # Mobile AIS station
-            ais[tag[1:6]] += 1
+class Flow:
+    """Compteurs d'un flux de trames (un type de trame ou toutes les trames).
+
+    Les intervalles entre trames sont comptés dans un histogramme logarithmique, ce qui
+    permet de fusionner les résultats de plusieurs morceaux sans garder les horodatages.
+    """
+
+    __slots__ = ("count", "first", "last", "histogram", "maximum", "active", "intervals", "dropouts")
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.histogram = array("Q", bytes(8 * BINS))
+        self.maximum = None  # plus grand intervalle (l'histogramme n'en donne qu'une borne)
+        self.active = 0.0  # somme des intervalles inférieurs à GAP
+        self.intervals = 0  # nombre de ces intervalles
+        self.dropouts = 0  # nombre d'intervalles supérieurs à GAP
+
+    def interval(self, dt, gap):
+        if dt > 0:
+            i = int(math.log10(dt / MIN_INTERVAL) * BINS_PER_DECADE)
+            self.histogram[min(max(i, 0), BINS - 1)] += 1
+        else:
+            self.histogram[0] += 1
+        if self.maximum is None or dt > self.maximum:
+            self.maximum = dt
+        if dt < gap:
+            self.active += dt
+            self.intervals += 1
+        else:
+            self.dropouts += 1
+
+    def add(self, timestamp, gap):
+        """Count a sentence, return the interval since the previous one (None for the first)."""
+        self.count += 1
+        last = self.last
+        self.last = timestamp
+        if last is None:
+            self.first = timestamp
+            return None
+        dt = timestamp - last
+        self.interval(dt, gap)
+        return dt
+
+    def merge(self, other, gap):
+        """Append the counters of a flow that follows this one. Return the interval between them."""
+        if other.count == 0:
+            return None
+        dt = None
+        if self.count == 0:
+            self.first = other.first
+        elif other.first >= self.last:
+            dt = other.first - self.last
+            self.interval(dt, gap)
+        self.count += other.count
+        self.last = other.last if self.last is None else max(self.last, other.last)
+        for i, n in enumerate(other.histogram):
+            if n:
+                self.histogram[i] += n
+        if other.maximum is not None and (self.maximum is None or other.maximum > self.maximum):
+            self.maximum = other.maximum
+        self.active += other.active
+        self.intervals += other.intervals
+        self.dropouts += other.dropouts
+        return dt
+
+    @property
+    def rate(self):
+        """Sentences per second, outside of the dropouts."""
+        return self.intervals / self.active if self.active > 0 else None
+
+    def percentile(self, p):
+        """Return the upper bound of the histogram bin of the percentile `p` of the intervals."""
+        total = sum(self.histogram)
+        if total == 0:
+            return None
+        rank = math.ceil(total * p / 100)
+        n = 0
+        for i, count in enumerate(self.histogram):
+            n += count
+            if n >= rank:
+                return MIN_INTERVAL * 10 ** ((i + 1) / BINS_PER_DECADE)
+
+
+class Stats:
+    """Statistiques d'un morceau de capture. Les morceaux successifs se fusionnent avec `merge`."""
+
+    def __init__(self, gap=GAP):
+        self.gap = gap
+        self.talker_ids = {}
+        self.flows = {}  # par type de trame ($) ou par tag (!AIVDM)
+        self.all = Flow()
+        self.gaps = []  # coupures (début, fin) de toutes les trames
+        self.unknown = 0
+        self.unknown_samples = []
+
+    def add(self, sentence):
+        raw = sentence.raw
+        if raw.startswith(b"$"):
+            talker_id = sentence.talker
+            self.talker_ids[talker_id] = self.talker_ids.get(talker_id, 0) + 1
+            key = sentence.type
+        elif raw.startswith(b"!AI"):  # Mobile AIS station
+            key = sentence.tag[1:]
         else:
-            print(f"UNKNOWN TAG {nmea}")
-            exit(2)
+            self.unknown += 1
+            if len(self.unknown_samples) < 5:
+                self.unknown_samples.append(raw)
+            return
+
+        timestamp = sentence.timestamp
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = Flow()
+        flow.add(timestamp, self.gap)
+        dt = self.all.add(timestamp, self.gap)
+        if dt is not None and dt >= self.gap and len(self.gaps) < MAX_GAPS:
+            self.gaps.append((timestamp - dt, timestamp))
+
+    def merge(self, other):
+        """Append the statistics of the following chunk."""
+        for talker_id, count in other.talker_ids.items():
+            self.talker_ids[talker_id] = self.talker_ids.get(talker_id, 0) + count
+        for key, flow in other.flows.items():
+            self.flows.setdefault(key, Flow()).merge(flow, self.gap)
+        last = self.all.last
+        dt = self.all.merge(other.all, self.gap)
+        if dt is not None and dt >= self.gap:
+            self.gaps.append((last, other.all.first))
+        self.gaps.extend(other.gaps)
+        del self.gaps[MAX_GAPS:]
+        self.unknown += other.unknown
+        self.unknown_samples = (self.unknown_samples + other.unknown_samples)[:5]
+
+
+def scan(chunk, gap=GAP):
+    stats = Stats(gap)
+    for sentence in read_chunk(*chunk):
+        stats.add(sentence)
+    return stats
+
+
+def ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+@click.command(help="Stats trames NMEA")
+@click.option("-j", "--jobs", type=click.IntRange(0), default=1, help="Nombre de processus (0: un par cœur)")
+@click.option("--chunk", type=click.IntRange(1), default=64, help="Taille des morceaux en Mo")
+@click.option("-g", "--gap", type=float, default=GAP, show_default=True, help="Durée d'une coupure en secondes")
+@click.argument("filenames", nargs=-1, required=True)
+def main(jobs, chunk, gap, filenames):
+    tasks = [c for filename in filenames for c in chunks(filename, chunk * 1024 * 1024)]
+
+    stats = Stats(gap)
+    if jobs == 1 or len(tasks) == 1:
+        results = (scan(task, gap) for task in tasks)
+        for result in results:
+            stats.merge(result)
+    else:
+        with ProcessPoolExecutor(jobs or None) as executor:
+            for result in executor.map(scan, tasks, [gap] * len(tasks)):
+                stats.merge(result)
 
     print("Talker IDs:")
-    for talker_id, count in talker_ids.items():
-        print(f"  {talker_id}   {TALKER_IDS[talker_id]:<62} {count:6}")
+    for talker_id, count in stats.talker_ids.items():
+        print(f"  {talker_id}   {TALKER_IDS.get(talker_id, '?'):<62} {count:6}")
 
     print("Sentences:")
-    for sentence, count in sentences.items():
-        print(f"  {sentence}  {SENTENCES[sentence]:<62} {count:6}")
+    print(f"  {'':<5} {'':<60} {'count':>6} {'Hz':>7} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'drops':>5}")
+    for key, flow in stats.flows.items():
+        description = SENTENCES.get(key, "?") if len(key) == 3 else ""
+        rate = "-" if flow.rate is None else f"{flow.rate:.2f}"
+        print(
+            f"  {key:<5} {description:<60} {flow.count:6} {rate:>7}"
+            f" {ms(flow.percentile(50)):>7} {ms(flow.percentile(99)):>7} {ms(flow.maximum):>7}"
+            f" {flow.dropouts:5}"
+        )
+
+    if stats.all.count:
+        print("Capture:")
+        print(f"  start  {datetime.fromtimestamp(stats.all.first).isoformat()}")
+        print(f"  end    {datetime.fromtimestamp(stats.all.last).isoformat()}")
+        print(f"  active {stats.all.active:.0f} s, {len(stats.gaps)} gaps over {gap:g} s")
+        for start, end in stats.gaps:
+            print(f"    {datetime.fromtimestamp(start).isoformat()} → {end - start:.1f} s")
 
-    print("AIS:")
-    for msg, count in ais.items():
-        print(f"  {msg}  {'':<60} {count:6}")
+    if stats.unknown:
+        print(f"Unknown tags: {stats.unknown}")
+        for raw in stats.unknown_samples:
+            print(f"  {raw.decode(errors='replace')}")
 
 
 if __name__ == "__main__":
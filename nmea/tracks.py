@@ -0,0 +1,260 @@
+# Traces GPS: positions horodatées des trames RMC/GGA/GLL, accumulation compacte avec décimation,
+# et écriture en flux au format KML, GPX ou GeoJSON.
+
+import json
+import math
+import shutil
+import sys
+import tempfile
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from nmea0183 import read_sentences
+
+EARTH_RADIUS = 6371000  # mètres
+DAY = 86400
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Return the distance in meters between two positions (haversine)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def isotime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def gps_fixes(sentences, talker=None):
+    """Yield `(timestamp, lat, lon)` of the GPS fixes of RMC, GGA and GLL sentences, in time order.
+
+    The timestamp is the UTC time of the fix. RMC gives the date; the time of day of GGA and GLL
+    is put on the day nearest to the last fix (or to the capture time before any fix).
+    A fix repeated by several sentences is yielded once. Without time in the sentence,
+    the capture time is used.
+    """
+    last = None  # (heure GPS, heure de capture) du dernier point
+    for sentence in sentences:
+        if talker is not None and sentence.talker != talker:
+            continue
+        position = sentence.position
+        if position is None:
+            continue
+        if sentence.type == "RMC" and sentence.datetime is not None:
+            timestamp = sentence.datetime.replace(tzinfo=timezone.utc).timestamp()
+        elif sentence.time is not None:
+            reference = sentence.timestamp if last is None else last[0] + sentence.timestamp - last[1]
+            timestamp = reference - reference % DAY + sentence.time
+            if timestamp - reference > DAY / 2:
+                timestamp -= DAY
+            elif reference - timestamp > DAY / 2:
+                timestamp += DAY
+        else:
+            timestamp = sentence.timestamp
+        if last is not None and timestamp <= last[0]:
+            continue
+        last = (timestamp, sentence.timestamp)
+        yield timestamp, *position
+
+
+class Decimator:
+    """Ne garde un point que s'il est à plus de `min_time` secondes et `min_distance` mètres du précédent gardé."""
+
+    __slots__ = ("min_time", "min_distance", "last")
+
+    def __init__(self, min_time=0, min_distance=0):
+        self.min_time = min_time
+        self.min_distance = min_distance
+        self.last = None
+
+    def keep(self, timestamp, lat, lon):
+        last = self.last
+        if last is not None:
+            if timestamp - last[0] < self.min_time:
+                return False
+            if self.min_distance and distance(last[1], last[2], lat, lon) < self.min_distance:
+                return False
+        self.last = (timestamp, lat, lon)
+        return True
+
+
+class Track:
+    """Trace d'un mobile: horodatages et positions dans des tableaux typés (24 octets par point)."""
+
+    __slots__ = ("name", "times", "lats", "lons", "decimator")
+
+    def __init__(self, name, min_time=0, min_distance=0):
+        self.name = name
+        self.times = array("d")
+        self.lats = array("d")
+        self.lons = array("d")
+        self.decimator = Decimator(min_time, min_distance) if min_time or min_distance else None
+
+    def __len__(self):
+        return len(self.times)
+
+    def add(self, timestamp, lat, lon):
+        if self.decimator and not self.decimator.keep(timestamp, lat, lon):
+            return
+        self.times.append(timestamp)
+        self.lats.append(lat)
+        self.lons.append(lon)
+
+    def points(self):
+        return zip(self.times, self.lats, self.lons)
+
+
+def copy_spill(spill, f):
+    """Copy a temporary file to `f` and empty it."""
+    spill.seek(0)
+    shutil.copyfileobj(spill, f)
+    spill.seek(0)
+    spill.truncate()
+
+
+class TrackWriter:
+    """Écrit des traces en flux: `begin_track`, `point` pour chaque point, `end_track`, puis `close`."""
+
+    def __init__(self, f):
+        self.f = f
+        self.write = f.write
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def track(self, track):
+        self.begin_track(track.name)
+        for timestamp, lat, lon in track.points():
+            self.point(timestamp, lat, lon)
+        self.end_track()
+
+    def close(self):
+        self.f.close()
+
+
+class GpxWriter(TrackWriter):
+    def __init__(self, f):
+        super().__init__(f)
+        self.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.write('<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="hauturier">\n')
+
+    def begin_track(self, name):
+        self.write(f"  <trk>\n    <name>{escape(name)}</name>\n    <trkseg>\n")
+
+    def point(self, timestamp, lat, lon):
+        self.write(f'      <trkpt lat="{lat}" lon="{lon}"><time>{isotime(timestamp)}</time></trkpt>\n')
+
+    def end_track(self):
+        self.write("    </trkseg>\n  </trk>\n")
+
+    def close(self):
+        self.write("</gpx>\n")
+        super().close()
+
+
+class KmlWriter(TrackWriter):
+    """Traces `gx:Track`: les `when` sont écrits en flux, les coordonnées dans un fichier temporaire
+    recopié à la fin de la trace."""
+
+    def __init__(self, f):
+        super().__init__(f)
+        self.coords = tempfile.TemporaryFile("w+")
+        self.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.write('<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n')
+        self.write("<Document>\n")
+
+    def begin_track(self, name):
+        self.write(f"  <Placemark>\n    <name>{escape(name)}</name>\n    <gx:Track>\n")
+        self.write("      <altitudeMode>clampToGround</altitudeMode>\n")
+
+    def point(self, timestamp, lat, lon):
+        self.write(f"      <when>{isotime(timestamp)}</when>\n")
+        self.coords.write(f"      <gx:coord>{lon} {lat} 0</gx:coord>\n")
+
+    def end_track(self):
+        copy_spill(self.coords, self.f)
+        self.write("    </gx:Track>\n  </Placemark>\n")
+
+    def close(self):
+        self.write("</Document>\n</kml>\n")
+        self.coords.close()
+        super().close()
+
+
+class GeoJsonWriter(TrackWriter):
+    """Traces `LineString`: les coordonnées sont écrites en flux, les horodatages (propriété `times`)
+    dans un fichier temporaire recopié à la fin de la trace."""
+
+    def __init__(self, f):
+        super().__init__(f)
+        self.times = tempfile.TemporaryFile("w+")
+        self.name = None
+        self.count = 0
+        self.points = 0
+        self.write('{"type":"FeatureCollection","features":[')
+
+    def begin_track(self, name):
+        self.write("\n" if self.count == 0 else ",\n")
+        self.count += 1
+        self.points = 0
+        self.name = name
+        self.write('{"type":"Feature","geometry":{"type":"LineString","coordinates":[')
+
+    def point(self, timestamp, lat, lon):
+        sep = "," if self.points else ""
+        self.write(f"{sep}[{lon},{lat}]")
+        self.times.write(f'{sep}"{isotime(timestamp)}"')
+        self.points += 1
+
+    def end_track(self):
+        self.write(f']}},"properties":{{"name":{json.dumps(self.name)},"times":[')
+        copy_spill(self.times, self.f)
+        self.write("]}}")
+
+    def close(self):
+        self.write("\n]}\n")
+        self.times.close()
+        super().close()
+
+
+WRITERS = {".gpx": GpxWriter, ".kml": KmlWriter, ".geojson": GeoJsonWriter, ".json": GeoJsonWriter}
+
+
+def open_writer(path):
+    """Return the track writer of the format given by the suffix of `path` (`-`: KML to stdout)."""
+    if str(path) == "-":
+        return KmlWriter(open(sys.stdout.fileno(), "w", closefd=False))
+    writer = WRITERS.get(path.suffix.lower())
+    if writer is None:
+        raise ValueError(f"{path}: unknown track format, use {', '.join(WRITERS)}")
+    return writer(open(path, "w"))
+
+
+def gps_track(suffix, filename, output="", talker=None, min_time=0, min_distance=0):
+    """Write the GPS track of the capture `filename` in the format of `suffix` (".gpx", ".kml"…)
+    to `output` (`""`: the capture name with `suffix`, `-`: stdout), decimated by time and distance."""
+    filename = Path(filename)
+    if output == "-":
+        print("output to stdout", file=sys.stderr)
+        f = open(sys.stdout.fileno(), "w", closefd=False)
+    else:
+        output = filename.with_suffix(suffix) if output == "" else Path(output)
+        print(f"output to {output}")
+        f = open(output, "w")
+
+    decimator = Decimator(min_time, min_distance)
+    count = 0
+    with WRITERS[suffix](f) as writer:
+        writer.begin_track(filename.stem)
+        for timestamp, lat, lon in gps_fixes(read_sentences(filename, types=["RMC", "GGA", "GLL"]), talker):
+            if decimator.keep(timestamp, lat, lon):
+                writer.point(timestamp, lat, lon)
+                count += 1
+        writer.end_track()
+    print(f"{count} points", file=sys.stderr)
@@ -1,22 +1,19 @@
 #!/usr/bin/env python3
 
-
-import logging
-
-logging.getLogger("scapy.runtime").setLevel(logging.ERROR + 1)
-
 import sys
 from datetime import datetime
 from pathlib import Path
 
 import click
-from scapy.all import IP, UDP, rdpcap
+
+from pcap import read_udp
 
 
-@click.command(help="Extrait les trames UDP port 11101 d'une capture (scapy version)")
+@click.command(help="Extrait les trames UDP port 11101 d'une capture")
+@click.option("--scapy", "opt_scapy", is_flag=True, help="Utiliser scapy pour décoder la capture")
 @click.argument("filename")
 @click.argument("output", default="")
-def main(filename, output):
+def main(opt_scapy, filename, output):
     if output == "-":
         out = sys.stdout
         print("output to stdout", file=sys.stderr)
@@ -28,13 +25,10 @@ def main(filename, output):
         print(f"output to {output}")
         out = output.open("w")
 
-    for p in rdpcap(filename):
-        u = p / IP() / UDP()
-        if u.sport == 11101 and u.len > 0:
-            s = u.load.decode()
-            for line in s.splitlines():
-                timestamp = datetime.fromtimestamp(float(p.time)).isoformat()
-                print(timestamp, line, file=out)
+    for ptime, payload in read_udp(filename, scapy=opt_scapy):
+        timestamp = datetime.fromtimestamp(ptime).isoformat()
+        for line in payload.decode().splitlines():
+            print(timestamp, line, file=out)
 
 
 if __name__ == "__main__":
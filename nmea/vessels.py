@@ -0,0 +1,140 @@
+# Registre des navires (données statiques et dernière position connue) construit à partir des captures AIS.
+# AIS info: https://gpsd.gitlab.io/gpsd/AIVDM.html
+
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+
+from aivdm import decode_chunks
+from nmea0183 import chunks
+
+STATIC = ("shipname", "callsign", "imo", "ship_type", "to_bow", "to_stern", "to_port", "to_starboard", "destination")
+DYNAMIC = ("lat", "lon", "speed", "course", "heading", "status")
+COLUMNS = ("mmsi", *STATIC, "static_time", *DYNAMIC, "position_time", "first_seen", "last_seen", "messages")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS vessels ({", ".join(COLUMNS)}, PRIMARY KEY (mmsi));
+CREATE TABLE IF NOT EXISTS names (mmsi, shipname, first_seen, last_seen, PRIMARY KEY (mmsi, shipname));
+CREATE TABLE IF NOT EXISTS files (path PRIMARY KEY, size, mtime_ns, position, timestamp);
+"""
+
+
+class Registry:
+    """Registre des navires par MMSI, dans une base SQLite.
+
+    Chaque capture a une marque de niveau (position et horodatage du dernier message lu):
+    une nouvelle lecture ne traite que ce qui a été ajouté depuis. Les changements de nom
+    sont conservés dans l'historique `names`.
+    Les navires sont chargés en mémoire et la base est mise à jour en une transaction par `update`.
+    """
+
+    def __init__(self, database=":memory:"):
+        self.db = sqlite3.connect(database)
+        self.db.executescript(SCHEMA)
+        self.vessels = {row[0]: list(row) for row in self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM vessels")}
+        self.names = defaultdict(dict)  # mmsi → shipname → [first_seen, last_seen]
+        for mmsi, shipname, first_seen, last_seen in self.db.execute("SELECT * FROM names"):
+            self.names[mmsi][shipname] = [first_seen, last_seen]
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, timestamp, message):
+        mmsi = int(message.mmsi)
+        vessel = self.vessels.get(mmsi)
+        if vessel is None:
+            vessel = self.vessels[mmsi] = [mmsi] + [None] * (len(COLUMNS) - 2) + [0]
+            vessel[COLUMNS.index("first_seen")] = timestamp
+        vessel[-1] += 1
+        i = COLUMNS.index("last_seen")
+        vessel[i] = timestamp if vessel[i] is None else max(vessel[i], timestamp)
+
+        shipname = getattr(message, "shipname", None)
+        if shipname:
+            names = self.names[mmsi]
+            name = names.get(shipname)
+            if name is None:
+                names[shipname] = [timestamp, timestamp]
+            else:
+                name[0], name[1] = min(name[0], timestamp), max(name[1], timestamp)
+
+        i = COLUMNS.index("static_time")
+        if any(hasattr(message, field) for field in STATIC[:-1]):
+            if vessel[i] is None or timestamp >= vessel[i]:
+                for n, field in enumerate(STATIC, 1):
+                    value = getattr(message, field, None)
+                    if value is not None and value != "":
+                        vessel[n] = int(value) if field == "ship_type" else value
+                vessel[i] = timestamp
+
+        i = COLUMNS.index("position_time")
+        lat, lon = getattr(message, "lat", None), getattr(message, "lon", None)
+        if lat is not None and lon is not None and abs(lat) <= 90 and abs(lon) <= 180:
+            if vessel[i] is None or timestamp >= vessel[i]:
+                for n, field in enumerate(DYNAMIC, COLUMNS.index("lat")):
+                    value = getattr(message, field, None)
+                    vessel[n] = int(value) if field == "status" and value is not None else value
+                vessel[i] = timestamp
+
+    def update(self, filenames, jobs=1, chunk_size=64 * 1024 * 1024):
+        """Read the new messages of the captures. Return the number of messages read."""
+        marks = {}
+        after = {}
+        tasks = []
+        for filename in filenames:
+            path = str(Path(filename).resolve())
+            stat = Path(filename).stat()
+            row = self.db.execute("SELECT size, mtime_ns, position, timestamp FROM files WHERE path=?", (path,))
+            size, mtime_ns, position, timestamp = row.fetchone() or (None, None, None, None)
+            if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                continue  # inchangée
+            if size is not None and stat.st_size < size:
+                position = timestamp = None  # remplacée: tout relire
+            file_tasks = chunks(filename, chunk_size, position or 0, whole_lines=True)
+            if file_tasks and file_tasks[0][1] is None:
+                # pcap: relue entièrement, seuls les messages postérieurs à la marque sont pris
+                after[str(filename)] = timestamp
+                end = None
+            else:
+                end = file_tasks[-1][2] if file_tasks else position
+            marks[str(filename)] = [path, stat.st_size, stat.st_mtime_ns, end, timestamp]
+            tasks.extend(file_tasks)
+
+        count = 0
+        for (filename, _, _), decoded in decode_chunks(tasks, jobs=jobs):
+            mark = marks[filename]
+            skip = after.get(filename)
+            for timestamp, message in decoded:
+                if skip is not None and timestamp <= skip:
+                    continue
+                self.add(timestamp, message)
+                count += 1
+            if decoded:
+                mark[4] = decoded[-1][0] if mark[4] is None else max(mark[4], decoded[-1][0])
+
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO vessels VALUES ({', '.join('?' * len(COLUMNS))})", self.vessels.values()
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)",
+                ((mmsi, shipname, *seen) for mmsi, names in self.names.items() for shipname, seen in names.items()),
+            )
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", marks.values())
+        return count
+
+    def history(self, mmsi):
+        """Return the names of a vessel as `(shipname, first_seen, last_seen)`, the most recent last."""
+        names = [(name, *seen) for name, seen in self.names.get(mmsi, {}).items()]
+        return sorted(names, key=lambda name: name[2])
+
+    def __iter__(self):
+        """Yield the vessels as dicts, by MMSI."""
+        for mmsi in sorted(self.vessels):
+            yield dict(zip(COLUMNS, self.vessels[mmsi]))